@@ -0,0 +1,111 @@
+import os
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Iterable, List
+import aiomysql
+from fastapi import HTTPException
+from . import db
+
+#############################################################
+# 記事メタデータの取得（ベクトル検索でヒットした ID だけを1クエリで取得し、LRU に保持する）
+
+# SELECT してよい列（環境変数で指定された列名をそのまま SQL に入れないための許可リスト）
+ALLOWED_COLUMNS = ("id", "title", "summary150", "summary1000", "content", "url", "published_date", "created_at")
+# /TopPage で返す列（フロントは本文 content を使わないので既定では取得しない）
+DEFAULT_COLUMNS = "id,title,summary150,summary1000,url,published_date,created_at"
+ARTICLE_COLUMNS = os.getenv("ARTICLE_COLUMNS", DEFAULT_COLUMNS)
+ARTICLE_CACHE_SIZE = int(os.getenv("ARTICLE_CACHE_SIZE", "2048"))
+
+
+def parse_columns(columns: str) -> List[str]:
+    names = [name.strip() for name in columns.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ALLOWED_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown article columns: {unknown}")
+    # id は結果の並べ替えとキャッシュのキーに使うので必ず含める
+    if "id" not in names:
+        names.insert(0, "id")
+    return names
+
+
+class ArticleMetadataStore:
+    """
+    article テーブルから指定列だけを取得するメタデータ層
+    取得した行は日時を ISO 形式に変換した状態で LRU に保持し、次回以降は DB に問い合わせない。
+    """
+
+    def __init__(self, columns: str = ARTICLE_COLUMNS, max_entries: int = ARTICLE_CACHE_SIZE):
+        self.columns = parse_columns(columns)
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get_many(self, article_ids: Iterable[int]) -> List[dict]:
+        """
+        article_ids と同じ順序で記事の行(dict)を返す（DBに存在しないIDは含めない）
+        """
+        article_ids = list(article_ids)
+        found = {}
+        with self._lock:
+            for article_id in article_ids:
+                row = self._cache.get(article_id)
+                if row is not None:
+                    self._cache.move_to_end(article_id)
+                    found[article_id] = row
+            self.hits += len(found)
+            missing_ids = [article_id for article_id in dict.fromkeys(article_ids) if article_id not in found]
+            self.misses += len(missing_ids)
+
+        if missing_ids:
+            rows = await self._fetch(missing_ids)
+            with self._lock:
+                for row in rows:
+                    found[row["id"]] = row
+                    self._cache[row["id"]] = row
+                    self._cache.move_to_end(row["id"])
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+
+        # キャッシュ上の行を呼び出し側が書き換えても影響しないようコピーを返す
+        return [dict(found[article_id]) for article_id in article_ids if article_id in found]
+
+    async def _fetch(self, article_ids: List[int]) -> List[dict]:
+        try:
+            async with db.async_connection() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    placeholders = ", ".join(["%s"] * len(article_ids))
+                    await cursor.execute(
+                        f"SELECT {', '.join(self.columns)} FROM article WHERE id IN ({placeholders})",
+                        tuple(article_ids)
+                    )
+                    rows = await cursor.fetchall()
+        except aiomysql.Error as err:
+            raise HTTPException(status_code=500, detail=f"Database query error: {err}")
+
+        for row in rows:
+            if isinstance(row.get("created_at"), (datetime.date, datetime.datetime)):
+                row["created_at"] = row["created_at"].isoformat()
+            if isinstance(row.get("published_date"), (datetime.date, datetime.datetime)):
+                row["published_date"] = row["published_date"].isoformat()
+        return rows
+
+    def invalidate(self, article_ids: Iterable[int] = None):
+        with self._lock:
+            if article_ids is None:
+                self._cache.clear()
+                return
+            for article_id in article_ids:
+                self._cache.pop(article_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "columns": self.columns,
+                "entries": len(self._cache),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
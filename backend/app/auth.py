@@ -4,12 +4,16 @@ from fastapi.responses import Response, RedirectResponse, JSONResponse
 from dotenv import load_dotenv
 import httpx
 import os
+import time
+import asyncio
+import threading
 import jwt
 import secrets
 from typing import Any
 from datetime import datetime, timedelta, timezone
 import mysql
 import json
+from . import db
 
 
 #############################################################
@@ -28,23 +32,65 @@ def create_session_id() -> str:
             return session_id
 
 # セッションを用いた検証
+# 多くのリクエストはキャッシュ（辞書の参照）だけで解決し、DBへの問い合わせは1クエリで済ませる
 async def get_current_user(session_id: str = Cookie(None)):
-    from .main import get_gmail
-    # print(f'ブラウザのsessionid: {session_id}')
-    if session_id is None or not get_session(session_id):
-        # print('ブラウザのセッションとデータベースのセッションが違った')
+    if session_id is None:
         return False
-    else:
-        user_id = get_session(session_id)[2]
-        # print(f'user_id: {user_id}')
-        user = get_gmail(user_id)
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Cloud not validate credentials",
-            )
+    user = lookup_session_cache(session_id)
+    if user is None:
+        # キャッシュにない場合だけ、イベントループを止めないよう別スレッドでDBに問い合わせる
+        user = await asyncio.to_thread(get_cached_session_user, session_id)
+    if user is None:
+        # print('ブラウザのセッションとデータベースのセッションが違った、または有効期限切れ')
+        return False
+    return user
+
+# キャッシュだけを参照してセッションのユーザーを返す（なければ None）
+def lookup_session_cache(session_id: str):
+    now = time.monotonic()
+    with _session_cache_lock:
+        cached = _session_cache.get(session_id)
+        if cached is not None:
+            user, cached_until = cached
+            if now < cached_until:
+                return user
+            del _session_cache[session_id]
+    return None
+
+# セッションIDからユーザー (id, gmail) を取得（キャッシュ優先）
+def get_cached_session_user(session_id: str):
+    user = lookup_session_cache(session_id)
+    if user is not None:
         return user
 
+    now = time.monotonic()
+    row = get_session_user(session_id)
+    if row is None:
+        return None
+    user_id, gmail, expires_at = row
+    user = (user_id, gmail)
+    # キャッシュの有効期限はTTLとセッション自体の有効期限の短い方
+    remaining = (expires_at - datetime.utcnow()).total_seconds() if isinstance(expires_at, datetime) else 0
+    cached_until = now + min(SESSION_CACHE_TTL_SECONDS, remaining)
+    with _session_cache_lock:
+        if len(_session_cache) >= SESSION_CACHE_MAX_ENTRIES:
+            _evict_session_cache(now)
+        _session_cache[session_id] = (user, cached_until)
+    return user
+
+# セッションのキャッシュを破棄（ログアウト時など）
+def invalidate_session_cache(session_id: str):
+    with _session_cache_lock:
+        _session_cache.pop(session_id, None)
+
+def _evict_session_cache(now: float):
+    expired = [key for key, (_, cached_until) in _session_cache.items() if cached_until <= now]
+    for key in expired:
+        del _session_cache[key]
+    # 期限切れがなければ古いものから削除
+    while len(_session_cache) >= SESSION_CACHE_MAX_ENTRIES:
+        del _session_cache[next(iter(_session_cache))]
+
 # ログインページリダイレクト専用関数
 def to_login():
     return RedirectResponse(url="http://localhost:3000")
@@ -65,6 +111,12 @@ TOKEN_URL = "https://oauth2.googleapis.com/token"
 ACCESS_TOKEN_EXPIRE_MINUTES = 10
 SESSION_ID_LENGTH = 32
 
+# セッション → ユーザーのキャッシュ {session_id: ((user_id, gmail), キャッシュ有効期限)}
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL", "60"))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+_session_cache = {}
+_session_cache_lock = threading.Lock()
+
 
 oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl=AUTHORIZATION_URL,
@@ -75,82 +127,104 @@ oauth2_scheme = OAuth2AuthorizationCodeBearer(
 # データベース関係
 # セッションの取得
 def get_session(session_id: str):
-    print(f'ブラウザのsessionid: {session_id}')
-    from .main import get_db_connection
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = "SELECT * FROM user_auth WHERE user_auth_id = (%s)"
-        cursor.execute(query, (session_id,))
-        session = cursor.fetchone()
-        if session is None:
-            print('データベースにuser_auth_idがありませんでした。')
-            return
-        else:
-            return session
-    except mysql.connector.Error as err:
-        print(f"Error gettin session: {err}")
-        return None
-    finally:
-        cursor.close()
-        conn.close()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "SELECT * FROM user_auth WHERE user_auth_id = (%s)"
+            cursor.execute(query, (session_id,))
+            session = cursor.fetchone()
+            if session is None:
+                return
+            else:
+                return session
+        except mysql.connector.Error as err:
+            print(f"Error gettin session: {err}")
+            return None
+        finally:
+            cursor.close()
+
+# 有効期限内のセッションのユーザーを取得 (user_id, gmail, 有効期限)
+def get_session_user(session_id: str):
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = (
+                "SELECT account.id, account.gmail, user_auth.date "
+                "FROM user_auth JOIN account ON account.id = user_auth.user_id "
+                "WHERE user_auth.user_auth_id = (%s) AND user_auth.date > UTC_TIMESTAMP()"
+            )
+            cursor.execute(query, (session_id,))
+            return cursor.fetchone()
+        except mysql.connector.Error as err:
+            print(f"Error getting session user: {err}")
+            return None
+        finally:
+            cursor.close()
+
+# セッションの削除
+def delete_session(session_id: str):
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "DELETE FROM user_auth WHERE user_auth_id = (%s)"
+            cursor.execute(query, (session_id,))
+            conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error deleting session: {err}")
+        finally:
+            cursor.close()
 
 # セッションの追加
 def add_session(session_id: str, user_id: int):
-    from .main import get_db_connection
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = "INSERT INTO user_auth (user_auth_id, user_id, date) VALUES (%s, %s, %s)"
-        expires_at = (datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)).strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute(query, (session_id, user_id, expires_at))
-        conn.commit()
-    except mysql.connector.Error as err:
-        conn.rollback()
-        print(f"Error adding session: {err}")
-    finally:
-        cursor.close()
-        conn.close()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "INSERT INTO user_auth (user_auth_id, user_id, date) VALUES (%s, %s, %s)"
+            expires_at = (datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)).strftime('%Y-%m-%d %H:%M:%S')
+            cursor.execute(query, (session_id, user_id, expires_at))
+            conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error adding session: {err}")
+        finally:
+            cursor.close()
 
 # アンケートに答えたかどうかの判別
 def answerd_survey(user_id: int):
-    from .main import get_db_connection
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = "SELECT * FROM survey WHERE userid = (%s)"
-        cursor.execute(query, (user_id,))
-        result = cursor.fetchone()
-        if result is None:
-            return False
-        else:
-            return True
-    except mysql.connector.Error as err:
-        print(f"Error getting user from surcey: {err}")
-        return None
-    finally:
-        cursor.close()
-        conn.close()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "SELECT * FROM survey WHERE userid = (%s)"
+            cursor.execute(query, (user_id,))
+            result = cursor.fetchone()
+            if result is None:
+                return False
+            else:
+                return True
+        except mysql.connector.Error as err:
+            print(f"Error getting user from surcey: {err}")
+            return None
+        finally:
+            cursor.close()
 
 # アンケート内容の取得
 def get_survey(user_id: int):
-    from .main import get_db_connection
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = "SELECT * FROM survey WHERE userid = (%s)"
-        cursor.execute(query, (user_id,))
-        survey = cursor.fetchone()
-        if survey is None:
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "SELECT * FROM survey WHERE userid = (%s)"
+            cursor.execute(query, (user_id,))
+            survey = cursor.fetchone()
+            if survey is None:
+                return None
+            else:
+                return survey
+        except mysql.connector.Error as err:
+            print(f"Error getting survey: {err}")
             return None
-        else:
-            return survey
-    except mysql.connector.Error as err:
-        print(f"Error getting survey: {err}")
-        return None
-    finally:
-        cursor.close()
-        conn.close()
+        finally:
+            cursor.close()
 
 #############################################################
 # ルート
@@ -170,8 +244,11 @@ async def login(current_user: Any = Depends(get_current_user)):
 
 # ログアウト
 @router.get("/logout")
-async def logout(response: Response):
+async def logout(response: Response, session_id: str = Cookie(None)):
     print("ログアウト処理が呼び出されました")
+    if session_id is not None:
+        invalidate_session_cache(session_id)
+        delete_session(session_id)
     response = RedirectResponse(url="http://localhost:3000")
     response.delete_cookie("session_id")
     return response
@@ -0,0 +1,87 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+# 一時的なエラーとして再試行する例外
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# 1リクエストあたりのテキスト数（API の上限は 2048）
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+# 同時に送信するバッチ数の上限
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+
+
+class BatchEmbedder:
+    """
+    複数のテキストを1回の embeddings.create にまとめてベクトル化するクライアント
+    バッチは最大 max_in_flight 個まで並行に送信し、結果は入力と同じ順序で返す。
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str = EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_in_flight: int = EMBEDDING_MAX_IN_FLIGHT,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        backoff_seconds: float = 1.0,
+    ):
+        self.client = client
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.embedded = 0
+        self.elapsed = 0.0
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        start = time.perf_counter()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            # map は投入順に結果を返すので、入力順がそのまま保たれる
+            batch_results = list(executor.map(self._embed_batch, batches))
+        self.elapsed += time.perf_counter() - start
+        self.embedded += len(texts)
+        return [embedding for batch in batch_results for embedding in batch]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._stats_lock:
+                    self.requests += 1
+                response = self.client.embeddings.create(input=batch, model=self.model)
+                data = sorted(response.data, key=lambda d: d.index)
+                return [d.embedding for d in data]
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                with self._stats_lock:
+                    self.retries += 1
+                wait = self.backoff_seconds * (2 ** attempt) + random.uniform(0, self.backoff_seconds)
+                print(f"埋め込みAPIの一時的なエラーのため {wait:.1f} 秒後に再試行します ({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(wait)
+
+    @property
+    def throughput(self) -> float:
+        """
+        1秒あたりにベクトル化した記事数
+        """
+        return self.embedded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report(self) -> str:
+        return (
+            f"{self.embedded} 件を {self.elapsed:.2f} 秒でベクトル化しました "
+            f"({self.throughput:.1f} 記事/秒, リクエスト数: {self.requests}, 再試行: {self.retries})"
+        )
@@ -0,0 +1,132 @@
+import os
+import re
+from typing import Tuple
+from bs4 import BeautifulSoup
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken がない環境では文字数で近似する
+    tiktoken = None
+
+#############################################################
+# 記事本文の抽出とトークン数の上限（web_Acquisition.py で LLM に渡す前に使う）
+#
+# ページ全体の get_text() にはナビゲーション・フッター・サイドバー・コメント欄などが含まれるため、
+# それらを取り除いて article / main の本文だけを残し、さらに CONTENT_TOKEN_BUDGET トークンで切り詰める。
+
+CONTENT_TOKEN_BUDGET = int(os.getenv("CONTENT_TOKEN_BUDGET", "4000"))
+TOKENIZER_MODEL = "gpt-4o-mini"
+# 本文候補の文字数がこれより少なければ抽出に失敗したとみなし、ページ全体のテキストを使う
+MIN_MAIN_TEXT_CHARS = 200
+
+# 本文を含まないタグ
+BOILERPLATE_TAGS = (
+    "script", "style", "noscript", "template", "iframe", "svg", "form", "button",
+    "nav", "header", "footer", "aside",
+)
+# class / id にこれらを含む要素は本文以外（メニュー・共有ボタン・関連記事・広告・コメント欄など）とみなす
+BOILERPLATE_PATTERN = re.compile(
+    r"(^|[-_\s])(nav|navbar|menu|breadcrumbs?|sidebar|side-bar|share|sns|social|"
+    r"related|recommend|ranking|ads?|advert\w*|banner|comments?|popup|modal|cookie)($|[-_\s])",
+    re.IGNORECASE,
+)
+# class / id が一致しても、ページのテキストのこの割合以上を含む要素はレイアウト全体の枠とみなして残す
+MAX_BOILERPLATE_TEXT_RATIO = 0.5
+# 本文の候補（上から順に探し、テキストが最も長い要素を採用する）
+MAIN_CANDIDATE_SELECTORS = ("article", "main", "[role=main]", "[itemprop=articleBody]")
+
+
+def _is_boilerplate(element) -> bool:
+    if element.attrs is None:
+        return False
+    names = " ".join(element.get("class") or []) + " " + (element.get("id") or "")
+    return bool(BOILERPLATE_PATTERN.search(names))
+
+
+def _contains_main(element) -> bool:
+    # 外側のレイアウト用の要素（class="l-container sidebar-layout" など）を消すと本文ごと消えてしまう
+    return element.find(("article", "main")) is not None
+
+
+def extract_main_text(html) -> Tuple[str, str]:
+    """
+    HTML から (本文と思われる部分のテキスト, ページ全体のテキスト) を返す
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    page_text = soup.get_text(separator="\n", strip=True)
+    title = soup.title.get_text(strip=True) if soup.title else ""
+
+    for tag in soup(BOILERPLATE_TAGS):
+        # 外側の要素と一緒に削除済みのものは飛ばす
+        if tag.decomposed:
+            continue
+        # 記事内の header / footer には見出しや著者・日付が入っていることが多いので残す
+        if tag.name in ("header", "footer") and tag.find_parent(("article", "main")):
+            continue
+        if _contains_main(tag):
+            continue
+        tag.decompose()
+    remaining_chars = len((soup.body or soup).get_text(strip=True))
+    for element in soup.find_all(_is_boilerplate):
+        if element.decomposed or element.name in ("html", "body", "article", "main") or _contains_main(element):
+            continue
+        if len(element.get_text(strip=True)) >= remaining_chars * MAX_BOILERPLATE_TEXT_RATIO:
+            continue
+        element.decompose()
+
+    candidates = [element for selector in MAIN_CANDIDATE_SELECTORS for element in soup.select(selector)]
+    if candidates:
+        texts = [element.get_text(separator="\n", strip=True) for element in candidates]
+        main_text = max(texts, key=len)
+    else:
+        body = soup.body or soup
+        main_text = body.get_text(separator="\n", strip=True)
+
+    if len(main_text) < MIN_MAIN_TEXT_CHARS:
+        return page_text, page_text
+    # タイトルは LLM がタイトルを抽出するときの手がかりになるので先頭に付ける
+    if title and title not in main_text:
+        main_text = f"{title}\n{main_text}"
+    return main_text, page_text
+
+
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+_encoding = _get_encoding()
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is None:
+        # 日本語はおおむね1文字1トークンなので、文字数を上限側の近似として使う
+        return len(text)
+    return len(_encoding.encode(text))
+
+
+def trim_to_budget(text: str, budget: int = CONTENT_TOKEN_BUDGET) -> Tuple[str, int, int]:
+    """
+    text を budget トークン以内に切り詰め、(切り詰めたテキスト, 元のトークン数, 残したトークン数) を返す
+    切り詰める場合は文の途中で切れないよう、上限内の最後の改行か句点までにする。
+    """
+    if _encoding is None:
+        tokens = None
+        original_tokens = len(text)
+    else:
+        tokens = _encoding.encode(text)
+        original_tokens = len(tokens)
+    if budget <= 0 or original_tokens <= budget:
+        return text, original_tokens, original_tokens
+
+    trimmed = text[:budget] if tokens is None else _encoding.decode(tokens[:budget])
+    boundary = max(trimmed.rfind("\n"), trimmed.rfind("。"), trimmed.rfind(". "))
+    # 区切りが前半にしかない場合は本文を大きく削らないよう、区切りを使わずにそのまま切る
+    if boundary >= len(trimmed) // 2:
+        trimmed = trimmed[:boundary + 1]
+    trimmed = trimmed.rstrip()
+    return trimmed, original_tokens, count_tokens(trimmed)
@@ -0,0 +1,294 @@
+import os
+import json
+import socket
+import hashlib
+import datetime
+from dataclasses import dataclass
+from typing import List, Optional
+from sqlalchemy import create_engine, inspect, Column, Integer, String, Text, DateTime, BINARY, Index, text, bindparam
+from sqlalchemy.orm import declarative_base
+
+#############################################################
+# MySQL 上のクロールジョブキュー（crawl_worker.py のワーカーが複数プロセスで取り出す）
+#
+# ステージ: discover → date_check → summarize → embed
+# - 同じ (stage, key) のジョブは dedup_key のユニークインデックスで1件しか登録されない
+# - ワーカーは SELECT ... FOR UPDATE SKIP LOCKED でジョブを取り出し、期限付きのリースを取る
+# - 実行中のワーカーは renew でリースを延長し続ける。リースが切れた実行中のジョブ（ワーカーが落ちた場合）は、他のワーカーが取り直す
+# - 失敗したジョブは max_attempts 回まで、間隔を空けて再実行する
+# - group_key を付けたジョブは、同じ (stage, group_key) で group_limit 件までしか登録しない（1回のクロールでの要約数の上限など）
+
+DATABASE_URL = "mysql+pymysql://user:password@db:3306/db?charset=utf8mb4"
+engine = create_engine(DATABASE_URL, echo=os.getenv("SQL_ECHO", "0") == "1", pool_pre_ping=True)
+Base = declarative_base()
+
+STAGES = ("discover", "date_check", "summarize", "embed")
+# リースの期限（秒）。これを過ぎても完了しないジョブは、ワーカーが落ちたものとみなす
+LEASE_SECONDS = int(os.getenv("CRAWL_JOB_LEASE_SECONDS", "900"))
+MAX_ATTEMPTS = int(os.getenv("CRAWL_JOB_MAX_ATTEMPTS", "3"))
+# 再実行までの待ち時間（秒）。試行のたびに2倍にする
+RETRY_BACKOFF_SECONDS = int(os.getenv("CRAWL_JOB_RETRY_BACKOFF", "60"))
+
+
+class CrawlJob(Base):
+    __tablename__ = "crawl_job"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    stage = Column(String(20), nullable=False)
+    # SHA-256("<stage>:<key>")（同じジョブを二重に登録しないためのキー）
+    dedup_key = Column(BINARY(32), nullable=False, unique=True)
+    payload = Column(Text, nullable=False)
+    group_key = Column(String(64), nullable=True)
+    status = Column(String(10), nullable=False, default="pending")  # pending / running / done / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=MAX_ATTEMPTS)
+    run_after = Column(DateTime, nullable=False)
+    lease_owner = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_crawl_job_stage_status_run_after", "stage", "status", "run_after"),
+        Index("ix_crawl_job_stage_group_key", "stage", "group_key"),
+    )
+
+
+Base.metadata.create_all(bind=engine)
+
+
+def migrate_group_key():
+    columns = {column["name"] for column in inspect(engine).get_columns(CrawlJob.__tablename__)}
+    if "group_key" in columns:
+        return
+    print("crawl_job に group_key 列を追加します。")
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE crawl_job ADD COLUMN group_key VARCHAR(64) NULL"))
+        conn.execute(text("ALTER TABLE crawl_job ADD INDEX ix_crawl_job_stage_group_key (stage, group_key)"))
+
+migrate_group_key()
+
+
+@dataclass
+class Job:
+    id: int
+    stage: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _dedup_key(stage: str, key: str) -> bytes:
+    return hashlib.sha256(f"{stage}:{key}".encode("utf-8")).digest()
+
+
+def enqueue(
+    stage: str,
+    jobs: List[tuple],
+    delay_seconds: int = 0,
+    group_key: Optional[str] = None,
+    group_limit: Optional[int] = None
+) -> int:
+    """
+    (key, payload) のリストをジョブとして登録し、新しく登録した件数を返す
+    同じ stage と key のジョブが既にあれば（完了済みでも）登録しないので、何度呼んでも結果は同じになる。
+    group_limit を指定すると、同じ group_key のジョブが合計 group_limit 件になったところで、残りは登録しない。
+    """
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage: {stage}")
+    if not jobs:
+        return 0
+    now = datetime.datetime.now()
+    run_after = now + datetime.timedelta(seconds=delay_seconds)
+    rows = [
+        {
+            "stage": stage,
+            "dedup_key": _dedup_key(stage, key),
+            "payload": json.dumps(payload, ensure_ascii=False),
+            "group_key": group_key,
+            "status": "pending",
+            "attempts": 0,
+            "max_attempts": MAX_ATTEMPTS,
+            "run_after": run_after,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for key, payload in jobs
+    ]
+    if group_limit is not None:
+        return _enqueue_limited(stage, rows, group_key, group_limit)
+    inserted = 0
+    with engine.begin() as conn:
+        for i in range(0, len(rows), 500):
+            result = conn.execute(CrawlJob.__table__.insert().prefix_with("IGNORE").values(rows[i:i + 500]))
+            inserted += result.rowcount
+    return inserted
+
+
+def _enqueue_limited(stage: str, rows: List[dict], group_key: str, group_limit: int) -> int:
+    # 複数のワーカーが同じグループに同時に登録しても上限を超えないよう、グループごとの MySQL のロックを取って数える
+    lock_name = "crawl_job:" + hashlib.sha256(f"{stage}:{group_key}".encode("utf-8")).hexdigest()[:48]
+    inserted = 0
+    # GET_LOCK は接続単位のロックなので、コミットしてから同じ接続で離す（コミット前に離すと他のワーカーが数え損なう）
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            if not conn.execute(text("SELECT GET_LOCK(:name, 30)"), {"name": lock_name}).scalar():
+                raise RuntimeError(f"ジョブの登録ロックを取得できませんでした: {stage} {group_key}")
+            # ロック付きの読み込みで、他のワーカーがコミットした最新の件数を数える
+            existing = conn.execute(
+                text(
+                    "SELECT COUNT(*) FROM crawl_job WHERE stage = :stage AND group_key = :group_key "
+                    "LOCK IN SHARE MODE"
+                ),
+                {"stage": stage, "group_key": group_key},
+            ).scalar()
+            remaining = group_limit - existing
+            position = 0
+            # 既に登録済みのジョブは INSERT IGNORE で数に入らないので、上限に達するまで残りの件数ずつ登録する
+            while position < len(rows) and inserted < remaining:
+                batch = rows[position:position + min(remaining - inserted, 500)]
+                position += len(batch)
+                result = conn.execute(CrawlJob.__table__.insert().prefix_with("IGNORE").values(batch))
+                inserted += result.rowcount
+            transaction.commit()
+        except Exception:
+            transaction.rollback()
+            raise
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": lock_name})
+    return inserted
+
+
+def count_group(stage: str, group_key: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT COUNT(*) FROM crawl_job WHERE stage = :stage AND group_key = :group_key"),
+            {"stage": stage, "group_key": group_key},
+        ).scalar()
+
+
+def lease(stage: str, limit: int, owner: str, lease_seconds: int = LEASE_SECONDS) -> List[Job]:
+    """
+    実行可能なジョブを最大 limit 件取り出してリースを取る
+    他のワーカーがロック中の行は SKIP LOCKED で飛ばすので、複数プロセスで同時に呼んでも同じジョブは取り合わない。
+    """
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT id, stage, payload, attempts, max_attempts FROM crawl_job "
+                "WHERE stage = :stage AND attempts < max_attempts AND ("
+                "  (status = 'pending' AND run_after <= NOW())"
+                "  OR (status = 'running' AND lease_expires_at < NOW())"
+                ") ORDER BY id LIMIT :limit FOR UPDATE SKIP LOCKED"
+            ),
+            {"stage": stage, "limit": limit},
+        ).fetchall()
+        if not rows:
+            return []
+        ids = [row.id for row in rows]
+        conn.execute(
+            text(
+                "UPDATE crawl_job SET status = 'running', lease_owner = :owner, "
+                "lease_expires_at = NOW() + INTERVAL :lease SECOND, attempts = attempts + 1, updated_at = NOW() "
+                "WHERE id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {"owner": owner, "lease": lease_seconds, "ids": ids},
+        )
+    return [Job(row.id, row.stage, json.loads(row.payload), row.attempts + 1, row.max_attempts) for row in rows]
+
+
+def renew(jobs: List[Job], owner: str, lease_seconds: int = LEASE_SECONDS) -> int:
+    """
+    処理中のジョブのリースを延長し、延長できた件数を返す（他のワーカーに取り直されたジョブは延長しない）
+    """
+    if not jobs:
+        return 0
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(
+                "UPDATE crawl_job SET lease_expires_at = NOW() + INTERVAL :lease SECOND, updated_at = NOW() "
+                "WHERE id IN :ids AND status = 'running' AND lease_owner = :owner"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {"owner": owner, "lease": lease_seconds, "ids": [job.id for job in jobs]},
+        )
+    return result.rowcount
+
+
+def complete(job: Job, owner: str):
+    """
+    ジョブを完了にする（リースを失ったワーカーからの完了報告は無視する）
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "UPDATE crawl_job SET status = 'done', lease_owner = NULL, lease_expires_at = NULL, "
+                "last_error = NULL, updated_at = NOW() WHERE id = :id AND lease_owner = :owner"
+            ),
+            {"id": job.id, "owner": owner},
+        )
+
+
+def fail(job: Job, owner: str, error: str):
+    """
+    ジョブを失敗にする（試行回数が残っていれば、待ち時間を空けて再実行する）
+    """
+    final = job.attempts >= job.max_attempts
+    backoff = RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "UPDATE crawl_job SET status = :status, lease_owner = NULL, lease_expires_at = NULL, "
+                "run_after = NOW() + INTERVAL :backoff SECOND, last_error = :error, updated_at = NOW() "
+                "WHERE id = :id AND lease_owner = :owner"
+            ),
+            {
+                "status": "failed" if final else "pending",
+                "backoff": backoff,
+                "error": error[:2000],
+                "id": job.id,
+                "owner": owner,
+            },
+        )
+
+
+def fail_abandoned():
+    """
+    試行回数を使い切ったままリースが切れたジョブ（実行中に毎回ワーカーが落ちたもの）を失敗にする
+    """
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(
+                "UPDATE crawl_job SET status = 'failed', last_error = 'lease expired', updated_at = NOW() "
+                "WHERE status = 'running' AND lease_expires_at < NOW() AND attempts >= max_attempts"
+            )
+        )
+    return result.rowcount
+
+
+def purge_finished(days: int = 7) -> int:
+    """
+    完了・失敗から days 日以上経ったジョブを削除する
+    """
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(
+                "DELETE FROM crawl_job WHERE status IN ('done', 'failed') "
+                "AND updated_at < NOW() - INTERVAL :days DAY"
+            ),
+            {"days": days},
+        )
+    return result.rowcount
+
+
+def stats() -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT stage, status, COUNT(*) AS n FROM crawl_job GROUP BY stage, status")).fetchall()
+    result = {stage: {} for stage in STAGES}
+    for row in rows:
+        result.setdefault(row.stage, {})[row.status] = row.n
+    return result
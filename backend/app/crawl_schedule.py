@@ -0,0 +1,230 @@
+import os
+import datetime
+from typing import Dict
+from sqlalchemy import Column, Integer, Float, DateTime, String, Boolean, text
+from sqlalchemy.orm import declarative_base
+from crawl_jobs import engine
+
+#############################################################
+# プラットフォームごとのクロール間隔（terminal_operation.py が discover ジョブを登録するときに使う）
+#
+# クロールのたびに「前回から何件の新しい記事が見つかったか」を記録し、1時間あたりの新規記事数を
+# 指数移動平均 (EWMA) で更新する。次回のクロールは、新規記事が TARGET_NEW_PER_CRAWL 件たまる頃に設定する。
+# 更新の多いプラットフォームほど頻繁に、少ないものほど間隔を空けて取得する。
+# 件数は未知のURLの数ではなく、公開日時の確認を通った（最近公開された）記事の数を使う。
+# Firecrawl やサイトマップの lastmod の更新で古いURLが大量に見つかっても、間隔が縮まないようにするため。
+# ジョブキューでは1回のクロールの確認が複数の date_check ジョブに分かれるので、crawl_tally に集計し、全て終わったときに記録する。
+
+# 1回のクロールで見つかることを目標にする新規記事数
+TARGET_NEW_PER_CRAWL = float(os.getenv("CRAWL_TARGET_NEW_PER_CRAWL", "5"))
+MIN_INTERVAL_HOURS = float(os.getenv("CRAWL_MIN_INTERVAL_HOURS", "1"))
+# 推薦の対象は直近3日分の記事なので、それより間隔を空けると取りこぼす
+MAX_INTERVAL_HOURS = float(os.getenv("CRAWL_MAX_INTERVAL_HOURS", "72"))
+# 新しい観測値の重み
+RATE_SMOOTHING = 0.3
+# 初回に保存済みの記事から平均を求める期間（日）
+BOOTSTRAP_DAYS = 7
+
+Base = declarative_base()
+
+
+class SourceSchedule(Base):
+    __tablename__ = "source_schedule"
+    source_id = Column(Integer, primary_key=True)
+    rate_per_hour = Column(Float, nullable=False, default=0.0)  # 1時間あたりの新規記事数（EWMA）
+    last_new_count = Column(Integer, nullable=False, default=0)
+    last_crawled_at = Column(DateTime, nullable=True)
+    next_crawl_at = Column(DateTime, nullable=False)
+
+
+class CrawlTally(Base):
+    """
+    ジョブキューでの1回のクロール（discover ジョブ）ごとの公開日時の確認状況
+    """
+    __tablename__ = "crawl_tally"
+    crawl_key = Column(String(64), primary_key=True)
+    source_id = Column(Integer, nullable=False)
+    expected = Column(Integer, nullable=True)    # 登録した date_check ジョブの数（discover ジョブが記録するまでは NULL）
+    checked = Column(Integer, nullable=False, default=0)
+    recent = Column(Integer, nullable=False, default=0)
+    recorded = Column(Boolean, nullable=False, default=False)
+    crawled_at = Column(DateTime, nullable=False)
+
+
+Base.metadata.create_all(bind=engine)
+
+
+def interval_hours(rate_per_hour: float) -> float:
+    if rate_per_hour <= 0:
+        return MAX_INTERVAL_HOURS
+    return min(MAX_INTERVAL_HOURS, max(MIN_INTERVAL_HOURS, TARGET_NEW_PER_CRAWL / rate_per_hour))
+
+
+def _bootstrap_rate(conn, source_id: int) -> float:
+    """
+    まだ記録がないプラットフォームは、直近に要約して保存した記事の数から平均を求める
+    （retrieved_urls は従来の毎日のクロールでサイト全体のURLが入っているため、記事の増える速さの目安にならない）
+    article には source_id がないので、retrieved_urls と url_hash で突き合わせる。
+    """
+    count = conn.execute(
+        text(
+            "SELECT COUNT(*) FROM article a "
+            "JOIN retrieved_urls r ON r.url_hash = UNHEX(SHA2(a.url, 256)) "
+            "WHERE r.source_id = :source_id AND a.created_at >= UTC_TIMESTAMP() - INTERVAL :days DAY"
+        ),
+        {"source_id": source_id, "days": BOOTSTRAP_DAYS},
+    ).scalar()
+    return count / (BOOTSTRAP_DAYS * 24)
+
+
+def due_sources(source_ids) -> Dict[int, datetime.datetime]:
+    """
+    クロールの時刻になったプラットフォームの {source_id: 予定時刻} を返す
+    記録のないプラットフォームは、すぐにクロールする予定で登録する。
+    """
+    now = datetime.datetime.now()
+    due = {}
+    with engine.begin() as conn:
+        rows = conn.execute(text("SELECT source_id, next_crawl_at FROM source_schedule")).fetchall()
+        scheduled = {row.source_id: row.next_crawl_at for row in rows}
+        for source_id in source_ids:
+            if source_id not in scheduled:
+                conn.execute(
+                    text(
+                        "INSERT IGNORE INTO source_schedule (source_id, rate_per_hour, last_new_count, next_crawl_at) "
+                        "VALUES (:source_id, :rate, 0, :now)"
+                    ),
+                    {"source_id": source_id, "rate": _bootstrap_rate(conn, source_id), "now": now},
+                )
+                scheduled[source_id] = now
+            if scheduled[source_id] <= now:
+                due[source_id] = scheduled[source_id]
+    return due
+
+
+def postpone(source_id: int, hours: float = MIN_INTERVAL_HOURS) -> datetime.datetime:
+    """
+    クロールに失敗したプラットフォームの次回の時刻を hours 時間後にする（記事の増える速さは変えない）
+    """
+    next_crawl_at = datetime.datetime.now() + datetime.timedelta(hours=hours)
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE source_schedule SET next_crawl_at = :next_crawl_at WHERE source_id = :source_id"),
+            {"source_id": source_id, "next_crawl_at": next_crawl_at},
+        )
+    return next_crawl_at
+
+
+def record_crawl(source_id: int, new_count: int, crawled_at: datetime.datetime = None) -> datetime.datetime:
+    """
+    クロールで見つかった新しい記事の数から記事の増える速さを更新し、次回のクロール時刻を返す
+    crawled_at はクロールした時刻（公開日時の確認が終わるのを待ってから記録する場合に、取得時点の時刻を渡す）
+    """
+    now = crawled_at or datetime.datetime.now()
+    with engine.begin() as conn:
+        row = conn.execute(
+            text("SELECT rate_per_hour, last_crawled_at FROM source_schedule WHERE source_id = :source_id FOR UPDATE"),
+            {"source_id": source_id},
+        ).fetchone()
+        if row is None:
+            rate = _bootstrap_rate(conn, source_id)
+        elif row.last_crawled_at is None:
+            rate = row.rate_per_hour
+        else:
+            hours = max((now - row.last_crawled_at).total_seconds() / 3600, MIN_INTERVAL_HOURS)
+            rate = RATE_SMOOTHING * (new_count / hours) + (1 - RATE_SMOOTHING) * row.rate_per_hour
+        next_crawl_at = now + datetime.timedelta(hours=interval_hours(rate))
+        conn.execute(
+            text(
+                "INSERT INTO source_schedule (source_id, rate_per_hour, last_new_count, last_crawled_at, next_crawl_at) "
+                "VALUES (:source_id, :rate, :new_count, :now, :next_crawl_at) "
+                "ON DUPLICATE KEY UPDATE rate_per_hour = VALUES(rate_per_hour), last_new_count = VALUES(last_new_count), "
+                "last_crawled_at = VALUES(last_crawled_at), next_crawl_at = VALUES(next_crawl_at)"
+            ),
+            {"source_id": source_id, "rate": rate, "new_count": new_count, "now": now, "next_crawl_at": next_crawl_at},
+        )
+    print(
+        f"プラットフォームID {source_id}: 新規 {new_count} 件、平均 {rate:.2f} 件/時、"
+        f"次回のクロールは {next_crawl_at:%Y-%m-%d %H:%M}"
+    )
+    return next_crawl_at
+
+
+
+def _finish_if_checked(crawl_key: str):
+    # 確認が全て終わっていれば、1回だけ記録する
+    with engine.begin() as conn:
+        row = conn.execute(
+            text("SELECT * FROM crawl_tally WHERE crawl_key = :crawl_key FOR UPDATE"),
+            {"crawl_key": crawl_key},
+        ).fetchone()
+        if row is None or row.recorded or row.expected is None or row.checked < row.expected:
+            return
+        conn.execute(text("UPDATE crawl_tally SET recorded = TRUE WHERE crawl_key = :crawl_key"), {"crawl_key": crawl_key})
+    record_crawl(row.source_id, row.recent, crawled_at=row.crawled_at)
+
+
+def start_crawl(crawl_key: str, source_id: int, expected: int):
+    """
+    ジョブキューでのクロールで登録した date_check ジョブの数を記録する（0件ならその場で新規0件として記録する）
+    date_check ジョブが先に終わって集計が始まっていても、ここで件数がそろった時点で記録する。
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO crawl_tally (crawl_key, source_id, expected, checked, recent, recorded, crawled_at) "
+                "VALUES (:crawl_key, :source_id, :expected, 0, 0, FALSE, :now) "
+                "ON DUPLICATE KEY UPDATE expected = VALUES(expected), crawled_at = VALUES(crawled_at)"
+            ),
+            {"crawl_key": crawl_key, "source_id": source_id, "expected": expected, "now": datetime.datetime.now()},
+        )
+    _finish_if_checked(crawl_key)
+
+
+def tally_crawl(crawl_key: str, source_id: int, checked: int, recent: int):
+    """
+    date_check の結果を集計し、そのクロールの確認が全て終わっていれば記事の増える速さを更新する
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO crawl_tally (crawl_key, source_id, expected, checked, recent, recorded, crawled_at) "
+                "VALUES (:crawl_key, :source_id, NULL, :checked, :recent, FALSE, :now) "
+                "ON DUPLICATE KEY UPDATE checked = checked + VALUES(checked), recent = recent + VALUES(recent)"
+            ),
+            {"crawl_key": crawl_key, "source_id": source_id, "checked": checked, "recent": recent, "now": datetime.datetime.now()},
+        )
+    _finish_if_checked(crawl_key)
+
+
+def purge_tallies(days: int = 7) -> int:
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("DELETE FROM crawl_tally WHERE crawled_at < NOW() - INTERVAL :days DAY"),
+            {"days": days},
+        )
+    return result.rowcount
+
+
+def finish_stale_crawls(hours: float = 6) -> int:
+    """
+    hours 時間たっても確認が終わらないクロール（ワーカーが落ち続けて失敗にした date_check ジョブがある場合など）を、
+    それまでの集計で記録する（記録しないと次回のクロール時刻が更新されず、discover ジョブが登録されない）
+    """
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT crawl_key FROM crawl_tally "
+                "WHERE recorded = FALSE AND crawled_at < NOW() - INTERVAL :hours HOUR"
+            ),
+            {"hours": hours},
+        ).fetchall()
+        # 残りを確認済みとして扱い、集計を締める
+        for row in rows:
+            conn.execute(
+                text("UPDATE crawl_tally SET expected = LEAST(COALESCE(expected, checked), checked) WHERE crawl_key = :crawl_key"),
+                {"crawl_key": row.crawl_key},
+            )
+    for row in rows:
+        _finish_if_checked(row.crawl_key)
+    return len(rows)
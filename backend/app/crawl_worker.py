@@ -0,0 +1,267 @@
+import os
+import time
+import asyncio
+import argparse
+import datetime
+import threading
+import contextlib
+from typing import Dict, List, Optional
+from sqlalchemy import select, text
+import crawl_jobs
+import crawl_schedule
+from crawl_jobs import Job
+from getdate import screen_urls
+from url_acquisition import retrieve_urls_from_platform, find_new_urls, record_urls, MAX_ARTICLES_PER_SOURCE
+import web_Acquisition
+from web_Acquisition import summarize_urls, SUMMARIZE_CONCURRENCY
+
+#############################################################
+# クロールジョブのワーカー（crawl_jobs.py のキューからジョブを取り出して処理する）
+#
+# 各ステージの処理は、途中で落ちて同じジョブを再実行しても結果が変わらないようにしている。
+# - discover:   新規URLの date_check ジョブを登録してから retrieved_urls に記録する
+# - date_check: 最近公開された記事の summarize ジョブを登録する（登録は URL ごとに1回だけ、1回のクロールで MAX_ARTICLES_PER_SOURCE 件まで）
+#               クロールの確認が全て終わったら、最近公開された記事の数で次回のクロール時刻を更新する
+# - summarize:  既に article にある URL や、既存の記事と本文が重複する URL は要約しない。保存できたら embed ジョブを登録する
+# - embed:      embedd.incremental_update は前回の登録位置から差分を反映するので、何度実行してもよい
+
+# 1回に取り出すジョブ数
+BATCH_SIZES = {
+    "discover": 1,
+    "date_check": int(os.getenv("DATE_CHECK_BATCH_SIZE", "50")),
+    "summarize": SUMMARIZE_CONCURRENCY,
+    "embed": 1,
+}
+# 後ろのステージから取り出し、途中まで進んだ記事を先に流す
+STAGE_PRIORITY = ("embed", "summarize", "date_check", "discover")
+# ジョブがないときに待つ時間（秒）
+POLL_INTERVAL_SECONDS = float(os.getenv("CRAWL_WORKER_POLL_INTERVAL", "10"))
+# 要約が保存されてから埋め込みを始めるまでの待ち時間（秒）。この間に保存された記事はまとめて1回で埋め込む
+EMBED_DELAY_SECONDS = int(os.getenv("EMBED_DELAY_SECONDS", "300"))
+# 処理中のジョブのリースを延長する間隔（秒）。リースの期限より十分短くし、DB に一時的につながらなくても切れないようにする
+HEARTBEAT_INTERVAL_SECONDS = max(crawl_jobs.LEASE_SECONDS // 5, 1)
+# 埋め込みの更新を複数のワーカーで同時に行わないための MySQL のロック名
+EMBED_LOCK_NAME = "crawl_embed_index"
+
+
+def discover(job: Job):
+    source_id, platform_url = job.payload["source_id"], job.payload["platform_url"]
+    print(f"処理中のプラットフォームID: {source_id}, URL: {platform_url}")
+    new_urls = find_new_urls(retrieve_urls_from_platform(platform_url))
+    # 要約数の上限はクロール（discover ジョブ）ごとに数える
+    crawl = f"{source_id}:{job.id}"
+    # 先にジョブを登録してから URL を記録する（間で落ちても、再実行時に同じURLが新規として見つかる）
+    queued = crawl_jobs.enqueue(
+        "date_check",
+        [(url, {"url": url, "source_id": source_id, "crawl": crawl}) for url in new_urls],
+        group_key=crawl,
+    )
+    record_urls(source_id, new_urls)
+    print(f"新規URL {len(new_urls)} 件のうち {queued} 件の公開日時の確認を登録しました。")
+    # 次回のクロール時刻は、公開日時の確認を通った記事の数で決める（date_check が全て終わったときに記録する）
+    # 再実行では新規URLが見つからないことがあるので、このクロールで登録済みの date_check ジョブを数える
+    crawl_schedule.start_crawl(crawl, source_id, crawl_jobs.count_group("date_check", crawl))
+
+
+def handle_discover(jobs: List[Job]) -> Dict[int, Optional[str]]:
+    results = {}
+    for job in jobs:
+        try:
+            discover(job)
+            results[job.id] = None
+        except Exception as e:
+            print(f"プラットフォームID {job.payload['source_id']} の取得に失敗しました: {e}")
+            results[job.id] = str(e)
+            if job.attempts >= job.max_attempts:
+                # 予定時刻が変わらないと同じキーの discover ジョブが登録されないため、次回の時刻をずらして登録し直させる
+                next_crawl_at = crawl_schedule.postpone(job.payload["source_id"])
+                print(f"試行回数を使い切ったため、次回のクロールを {next_crawl_at:%Y-%m-%d %H:%M} にします。")
+    return results
+
+
+def handle_date_check(jobs: List[Job]) -> Dict[int, Optional[str]]:
+    checks = asyncio.run(screen_urls([job.payload["url"] for job in jobs]))
+    recent = {}
+    results = {}
+    tallies = {}  # (crawl, source_id): [確認が終わった数, 最近公開された記事の数]
+    for job, check in zip(jobs, checks):
+        # 一時的な取得の失敗は、失敗として間隔を空けて再実行する（URL は retrieved_urls に記録済みなので、ここで落とすと二度と見つからない）
+        results[job.id] = check.error if check.retryable else None
+        if job.payload.get("crawl") and (not check.retryable or job.attempts >= job.max_attempts):
+            tally = tallies.setdefault((job.payload["crawl"], job.payload.get("source_id")), [0, 0])
+            tally[0] += 1
+            tally[1] += int(check.is_recent)
+        if check.is_recent:
+            # crawl のない古いジョブは、プラットフォームごとに1日単位で数える
+            crawl = job.payload.get("crawl") or f"{job.payload.get('source_id')}:{datetime.date.today().isoformat()}"
+            recent.setdefault(crawl, []).append((check.url, {"url": check.url, "source_id": job.payload.get("source_id")}))
+        elif check.retryable:
+            print(f"→ {check.url} は時間を置いて確認し直します: {check.error}")
+        elif check.error:
+            print(f"→ {check.url} は除外されます: {check.error}")
+    # 旧来の url_acquisition.py と同じく、1プラットフォームの1回のクロールで要約するのは MAX_ARTICLES_PER_SOURCE 件まで
+    queued = sum(
+        crawl_jobs.enqueue("summarize", entries, group_key=crawl, group_limit=MAX_ARTICLES_PER_SOURCE)
+        for crawl, entries in recent.items()
+    )
+    recent_count = sum(len(entries) for entries in recent.values())
+    print(f"{len(checks)} 件の公開日時を確認し、最近の記事 {recent_count} 件のうち {queued} 件の要約を登録しました。")
+    for (crawl, source_id), (checked, recent_in_crawl) in tallies.items():
+        crawl_schedule.tally_crawl(crawl, source_id, checked, recent_in_crawl)
+    # 公開日時がない・古い・4xx など、再実行しても結果が変わらないものは完了にする
+    return results
+
+
+def _saved_urls(urls: List[str]) -> set:
+    with web_Acquisition.engine.connect() as conn:
+        rows = conn.execute(select(web_Acquisition.Article.url).where(web_Acquisition.Article.url.in_(urls)))
+        return {row[0] for row in rows}
+
+
+def handle_summarize(jobs: List[Job]) -> Dict[int, Optional[str]]:
+    urls = [job.payload["url"] for job in jobs]
+    saved = _saved_urls(urls)
+    if saved:
+        print(f"既に保存済みの {len(saved)} 件は要約しません。")
+    results = {job.id: None for job in jobs if job.payload["url"] in saved}
+    pending = [job for job in jobs if job.payload["url"] not in saved]
+    summaries = summarize_urls([job.payload["url"] for job in pending])
+    saved_count = 0
+    duplicates = [summary for summary in summaries if summary.duplicate_of]
+    for job, summary in zip(pending, summaries):
+        if summary.saved:
+            saved_count += 1
+            print(f"保存しました: {summary.url} (article_id: {summary.article_id}, {summary.elapsed_seconds:.1f} 秒)")
+        elif summary.duplicate_of:
+            print(f"既存の記事と重複しています: {summary.url} (article_id: {summary.duplicate_of})")
+        else:
+            print(f"保存されませんでした: {summary.url} ({summary.error})")
+        # 評価に落ちて保存されなかった記事は、再実行しても LLM の費用がかかるだけなので完了にする
+        results[job.id] = summary.error if summary.crashed else None
+    if duplicates:
+        llm_calls_saved = sum(summary.llm_calls_saved for summary in duplicates)
+        print(f"重複記事 {len(duplicates)} 件の要約を省き、LLM の呼び出しを少なくとも {llm_calls_saved} 回減らしました。")
+    if saved_count:
+        # 同じ時間枠に保存された記事の埋め込みは1つのジョブにまとめる
+        bucket = int(time.time()) // max(EMBED_DELAY_SECONDS, 1)
+        crawl_jobs.enqueue("embed", [(str(bucket), {"bucket": bucket})], delay_seconds=EMBED_DELAY_SECONDS)
+    return results
+
+
+def handle_embed(jobs: List[Job]) -> Dict[int, Optional[str]]:
+    # embedd は OpenAI クライアントなどを作るので、埋め込みを担当するときだけ読み込む
+    import embedd
+    with crawl_jobs.engine.connect() as conn:
+        locked = conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": EMBED_LOCK_NAME}).scalar()
+        if not locked:
+            return {job.id: "他のワーカーが埋め込みを更新中です" for job in jobs}
+        try:
+            embedd.incremental_update()
+            print(embedd.embedder.report())
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": EMBED_LOCK_NAME})
+    return {job.id: None for job in jobs}
+
+
+HANDLERS = {
+    "discover": handle_discover,
+    "date_check": handle_date_check,
+    "summarize": handle_summarize,
+    "embed": handle_embed,
+}
+
+
+@contextlib.contextmanager
+def heartbeat(jobs: List[Job], owner: str):
+    """
+    処理中はリースを延長し続ける（Firecrawl での取得や要約がリースの期限より長くかかっても、他のワーカーに取り直されない）
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_INTERVAL_SECONDS):
+            try:
+                renewed = crawl_jobs.renew(jobs, owner)
+                if renewed < len(jobs):
+                    print(f"{len(jobs) - renewed} 件のジョブのリースが他のワーカーに移っています。（{owner}）")
+            except Exception as e:
+                print(f"リースの延長に失敗しました: {e}")
+
+    thread = threading.Thread(target=beat, name="crawl-job-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def process(stage: str, jobs: List[Job], owner: str):
+    try:
+        with heartbeat(jobs, owner):
+            results = HANDLERS[stage](jobs)
+    except Exception as e:
+        print(f"[{stage}] ジョブの処理に失敗しました: {e}")
+        results = {job.id: str(e) for job in jobs}
+    for job in jobs:
+        error = results.get(job.id)
+        if error is None:
+            crawl_jobs.complete(job, owner)
+        else:
+            crawl_jobs.fail(job, owner, error)
+
+
+def run_once(owner: str, stages=STAGE_PRIORITY) -> int:
+    """
+    優先順位の高いステージから1バッチだけ取り出して処理し、処理したジョブ数を返す
+    """
+    for stage in STAGE_PRIORITY:
+        if stage not in stages:
+            continue
+        jobs = crawl_jobs.lease(stage, BATCH_SIZES[stage], owner)
+        if jobs:
+            print(f"[{stage}] {len(jobs)} 件のジョブを処理します。（{owner}）")
+            process(stage, jobs, owner)
+            return len(jobs)
+    return 0
+
+
+def run_worker(stages=STAGE_PRIORITY, drain: bool = False):
+    """
+    ジョブを処理し続ける（drain=True のときは、実行できるジョブがなくなったら終了する）
+    """
+    owner = crawl_jobs.worker_id()
+    print(f"クロールワーカーを開始しました。（{owner}, ステージ: {', '.join(stages)}）")
+    while True:
+        try:
+            processed = run_once(owner, stages)
+        except Exception as e:
+            # DB に一時的につながらない場合などは、待ってから続ける
+            print(f"ジョブの取り出しに失敗しました: {e}")
+            processed = 0
+        if processed:
+            continue
+        if drain:
+            print(f"実行できるジョブがなくなりました。{datetime.datetime.now().isoformat()}")
+            return
+        time.sleep(POLL_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="クロールジョブのワーカー")
+    parser.add_argument(
+        "--stages",
+        default=",".join(STAGE_PRIORITY),
+        help="処理するステージ（カンマ区切り）"
+    )
+    parser.add_argument(
+        "--drain",
+        action="store_true",
+        help="実行できるジョブがなくなったら終了する"
+    )
+    args = parser.parse_args()
+    stages = tuple(stage.strip() for stage in args.stages.split(",") if stage.strip())
+    unknown = [stage for stage in stages if stage not in crawl_jobs.STAGES]
+    if unknown:
+        parser.error(f"不明なステージ: {', '.join(unknown)}")
+    run_worker(stages, drain=args.drain)
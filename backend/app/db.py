@@ -0,0 +1,213 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+import aiomysql
+import mysql.connector
+from fastapi import HTTPException
+
+#############################################################
+# MySQL コネクションプール（main.py と auth.py で共有）
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "db"),  # docker-composeの場合、MySQLコンテナのサービス名
+    "user": os.getenv("DB_USER", "user"),
+    "password": os.getenv("DB_PASSWORD", "password"),
+    "database": os.getenv("DB_NAME", "db"),
+    "use_unicode": True,
+    "charset": "utf8mb4",
+    "buffered": True,
+}
+# プールの最大接続数
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+# 空き接続を待つ最大秒数
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# この秒数以上使われていなかった接続は、貸し出す前に ping で生存確認する
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+
+
+class ConnectionPool:
+    """
+    上限付きのコネクションプール
+    接続は最大 size 本まで作成し、返却された接続は次の貸し出しで再利用する。
+    """
+
+    def __init__(self, size: int, timeout: float, ping_after: float, **config):
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.config = config
+        self._idle = queue.LifoQueue()  # (接続, 返却時刻)
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._created = 0
+        self._checkouts = 0
+        self._waited_checkouts = 0
+        self._timeouts = 0
+        self._unhealthy = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self):
+        try:
+            conn = mysql.connector.connect(**self.config)
+        except mysql.connector.Error as err:
+            raise HTTPException(status_code=500, detail=f"Database connection error: {err}")
+        with self._stats_lock:
+            self._created += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def acquire(self):
+        start = time.monotonic()
+        waited = not self._slots.acquire(blocking=False)
+        if waited and not self._slots.acquire(timeout=self.timeout):
+            with self._stats_lock:
+                self._timeouts += 1
+            raise HTTPException(status_code=503, detail="Database connection pool exhausted")
+        wait = time.monotonic() - start
+
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    candidate, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                    break
+                if self._is_healthy(candidate, idle_since):
+                    conn = candidate
+                else:
+                    with self._stats_lock:
+                        self._unhealthy += 1
+                    self._close_quietly(candidate)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._stats_lock:
+            self._checkouts += 1
+            self._waited_checkouts += 1 if waited else 0
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        return conn
+
+    def release(self, conn):
+        try:
+            # コミットされていないトランザクション（SELECT のスナップショットを含む）を終わらせてから返却
+            conn.rollback()
+            self._idle.put((conn, time.monotonic()))
+        except mysql.connector.Error:
+            self._close_quietly(conn)
+        finally:
+            with self._stats_lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "peak_in_use": self._peak_in_use,
+                "saturation": self._in_use / self.size if self.size else 0.0,
+                "created": self._created,
+                "checkouts": self._checkouts,
+                "waited_checkouts": self._waited_checkouts,
+                "timeouts": self._timeouts,
+                "unhealthy_discarded": self._unhealthy,
+                "avg_wait_ms": (self._total_wait / self._checkouts * 1000) if self._checkouts else 0.0,
+                "max_wait_ms": self._max_wait * 1000,
+            }
+
+
+pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER, **DB_CONFIG)
+
+
+def connection():
+    """
+    プールから接続を借りるコンテキストマネージャ
+
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            ...
+    """
+    return pool.connection()
+
+
+#############################################################
+# 非同期コネクションプール（async エンドポイント用、aiomysql）
+
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+
+async def get_async_pool():
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                _async_pool = await aiomysql.create_pool(
+                    host=DB_CONFIG["host"],
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"],
+                    db=DB_CONFIG["database"],
+                    charset=DB_CONFIG["charset"],
+                    # 読み取り専用の問い合わせが古いスナップショットを見続けないようにする
+                    autocommit=True,
+                    minsize=1,
+                    maxsize=DB_POOL_SIZE,
+                    pool_recycle=3600,
+                )
+    return _async_pool
+
+
+@asynccontextmanager
+async def async_connection():
+    """
+    非同期プールから接続を借りるコンテキストマネージャ
+
+        async with db.async_connection() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                ...
+    """
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        yield conn
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        _async_pool.close()
+        await _async_pool.wait_closed()
+        _async_pool = None
@@ -17,7 +17,11 @@ from langchain.vectorstores import FAISS
 from langchain.embeddings.base import Embeddings
 from typing import List
 import mysql.connector
+import argparse
 from pydantic import BaseModel
+import vector_index
+from batch_embedder import BatchEmbedder
+from embedding_cache import EmbeddingCache, text_hash
 
 # .env ファイルを読み込む
 load_dotenv()
@@ -40,7 +44,7 @@ def get_db_connection():
         )
         return conn
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database connection error: {err}")
+        raise Exception(f"Database connection error: {err}")
     
 class BlogPostSchema(BaseModel):
     id: int
@@ -52,17 +56,26 @@ class BlogPostSchema(BaseModel):
     published_date: str  # 日付は文字列として扱います
     created_at: str
 
+# インデックスに含める記事の期間（日）
+WINDOW_DAYS = 3
+
 # 記事データを取得して article_list に格納する関数
-def read_articles():
+# after_id を指定すると、それより新しい（id が大きい）記事だけを取得する
+def read_articles(after_id=None):
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(
+        query = (
             "SELECT id, title, summary150, summary1000, content, url, published_date, created_at "
             "FROM article "
-            "WHERE published_date >= DATE_SUB(NOW(), INTERVAL 3 DAY) "
-            "ORDER BY published_date DESC"
+            "WHERE published_date >= DATE_SUB(NOW(), INTERVAL %s DAY) "
         )
+        params = [WINDOW_DAYS]
+        if after_id is not None:
+            query += "AND id > %s "
+            params.append(after_id)
+        query += "ORDER BY published_date DESC"
+        cursor.execute(query, tuple(params))
         rows = cursor.fetchall()
         cursor.close()
         conn.close()
@@ -88,8 +101,23 @@ def read_articles():
     except mysql.connector.Error as err:
         raise Exception(f"Database query error: {err}")
 
-# 記事データを取得
-article_list = read_articles()
+# インデックス対象期間内にある記事の id だけを取得する関数
+def read_window_article_ids():
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id FROM article "
+            "WHERE published_date >= DATE_SUB(NOW(), INTERVAL %s DAY) "
+            "AND title IS NOT NULL AND summary1000 IS NOT NULL",
+            (WINDOW_DAYS,)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        return [row[0] for row in rows]
+    except mysql.connector.Error as err:
+        raise Exception(f"Database query error: {err}")
 
 # 前処理関数（HTMLタグの除去 & 空白削除）
 def preprocess_text(text):
@@ -97,50 +125,177 @@ def preprocess_text(text):
     text = re.sub(r'\s+', ' ', text).strip()  # 余計な空白の削除
     return text
 
-# OpenAI APIを用いてテキストをベクトル化する関数
-def get_embedding(text, model="text-embedding-ada-002"):
-    response = openai.embeddings.create(
-        input=text,
-        model=model
+# 記事をまとめてベクトル化するクライアント（複数記事を1リクエストで送信し、並行実行する）
+embedder = BatchEmbedder(openai)
+# 前回までに計算した埋め込みのキャッシュ（モデル名 + 前処理済みテキストのハッシュがキー）
+embedding_cache = EmbeddingCache(get_db_connection, embedder.model)
+
+# 記事リストをベクトル化して (article.id のリスト, ベクトルのリスト) を返す関数
+def embed_articles(article_list):
+    # 各記事のベクトル化対象テキストを作る（例：記事タイトルと本文を連結）
+    # FAISS には位置ではなく article.id を登録するため、テキストと同じ順序で ID も保持する
+    texts_to_embed = []
+    article_ids = []
+    for article in article_list:
+        if article[1] is None or article[3] is None:
+            print(f"Skipping article ID {article[0]} due to missing summary.")
+            continue  # summary150 または summary1000 が None の場合、スキップ
+        text_to_embed = "タイトル：" + str(article[1]) + "\n" + "本文" + str(article[3])
+        text_to_embed = preprocess_text(text_to_embed)
+        texts_to_embed.append(text_to_embed)
+        article_ids.append(article[0])
+
+    # キャッシュにあるベクトルはそのまま使い、新規・変更された記事だけをAPIでベクトル化する
+    text_hashes = [text_hash(text) for text in texts_to_embed]
+    cached_vectors = embedding_cache.get_many(text_hashes)
+    miss_positions = [i for i, hash_value in enumerate(text_hashes) if hash_value not in cached_vectors]
+
+    # 入力と同じ順序でベクトルが返る
+    new_vectors = embedder.embed([texts_to_embed[i] for i in miss_positions])
+    embedding_cache.put_many([
+        (text_hashes[i], article_ids[i], vector) for i, vector in zip(miss_positions, new_vectors)
+    ])
+
+    embeddings = [cached_vectors.get(hash_value) for hash_value in text_hashes]
+    for i, vector in zip(miss_positions, new_vectors):
+        embeddings[i] = vector
+    return article_ids, embeddings
+
+# 新しい HNSW インデックスを作成する関数
+def build_index(embeddings_np, ids_np):
+    # 埋め込みを正規化（L2ノルムを1にする）
+    #embeddings_np /= np.linalg.norm(embeddings_np, axis=1, keepdims=True)
+
+    # FAISS のインデックスを作成（ここでは L2 距離を用いた平坦なインデックス）
+    dim = embeddings_np.shape[1]  # 埋め込みベクトルの次元数
+
+    # FAISS のインデックスを作成（内積ベース）
+    #index = faiss.IndexFlatIP(dim)
+
+    #index = faiss.IndexFlatL2(dim)
+
+    hnsw_index = faiss.IndexHNSWFlat(dim, 32)  # 32はHNSWのネイバー数
+    hnsw_index.hnsw.efSearch = 64  # 検索時の探索範囲を設定
+
+    # 検索結果として article.id を返すように ID マップでラップする
+    index = faiss.IndexIDMap2(hnsw_index)
+    index.add_with_ids(embeddings_np, ids_np)
+    return index
+
+# インデックスに登録されている article.id の一覧
+def indexed_article_ids(index):
+    return faiss.vector_to_array(index.id_map).tolist()
+
+# インデックスから記事を削除する関数
+def remove_articles(index, remove_ids):
+    ids_np = np.array(sorted(remove_ids)).astype('int64')
+    try:
+        index.remove_ids(ids_np)
+        return index
+    except RuntimeError:
+        # HNSW はその場での削除ができないため、残す記事のベクトルをインデックスから
+        # 復元してグラフを作り直す（埋め込みAPIもDBも使わない）
+        remove_set = set(remove_ids)
+        keep_ids = [article_id for article_id in indexed_article_ids(index) if article_id not in remove_set]
+        if not keep_ids:
+            return None
+        keep_vectors = np.vstack([index.reconstruct(int(article_id)) for article_id in keep_ids])
+        return build_index(keep_vectors.astype('float32'), np.array(keep_ids).astype('int64'))
+
+# 公開するインデックスの最終登録位置（次回の差分更新はこれより新しい記事だけを対象にする）
+def make_watermark(article_list, previous=None):
+    max_id = previous.get("max_article_id") if previous else None
+    max_created_at = previous.get("max_created_at") if previous else None
+    for article in article_list:
+        if max_id is None or article[0] > max_id:
+            max_id = article[0]
+        created_at = article[7].isoformat() if article[7] else None
+        if created_at and (max_created_at is None or created_at > max_created_at):
+            max_created_at = created_at
+    return {"max_article_id": max_id, "max_created_at": max_created_at}
+
+def publish(index, watermark):
+    # FAISS インデックスを新しいバージョンとして公開（API 側が自動で読み込み直す）
+    manifest = vector_index.publish_index(
+        index, extra={"watermark": watermark, "window_days": WINDOW_DAYS}
     )
-    # response["data"] はリストなので、最初のembeddingを返す
-    return response.data[0].embedding
+    print("登録されたベクトル数:", index.ntotal)
+    print(f"FAISS インデックスを保存しました。version: {manifest['version']}, 保存先: {vector_index.INDEX_DIR}")
+    return manifest
 
-# 各記事を1件ずつベクトル化する（例：記事タイトルと本文を連結）
-embeddings = []
-for article in article_list:
-    if article[1] is None or article[3] is None:
-        print(f"Skipping article ID {article[0]} due to missing summary.")
-        continue  # summary150 または summary1000 が None の場合、スキップ
-    text_to_embed = "タイトル：" + str(article[1]) + "\n" + "本文" + str(article[3])
-    text_to_embed = preprocess_text(text_to_embed)
-    embedding = get_embedding(text_to_embed)
-    embeddings.append(embedding)
+# 対象期間の全記事からインデックスを作り直す
+def full_rebuild():
+    print("インデックスを全件から作り直します。")
+    article_list = read_articles()
+    article_ids, embeddings = embed_articles(article_list)
 
-# embeddings を numpy 配列に変換（FAISSは float32 の numpy 配列が必要）
-embeddings_np = np.array(embeddings).astype('float32')
-# 埋め込みを正規化（L2ノルムを1にする）
-#embeddings_np /= np.linalg.norm(embeddings_np, axis=1, keepdims=True)
+    # インデックス対象期間から外れた記事のキャッシュを削除
+    evicted = embedding_cache.evict_except(article_ids)
+    print(f"{embedding_cache.report()}, 削除 {evicted} 件")
 
-# FAISS のインデックスを作成（ここでは L2 距離を用いた平坦なインデックス）
-dim = embeddings_np.shape[1]  # 埋め込みベクトルの次元数
+    if not embeddings:
+        print("インデックスに登録できる記事がありません。")
+        return None
 
-# FAISS のインデックスを作成（内積ベース）
-index = faiss.IndexFlatIP(dim)
+    # embeddings を numpy 配列に変換（FAISSは float32 の numpy 配列が必要）
+    embeddings_np = np.array(embeddings).astype('float32')
+    # ID は int64 の numpy 配列が必要
+    ids_np = np.array(article_ids).astype('int64')
+    index = build_index(embeddings_np, ids_np)
+    return publish(index, make_watermark(article_list))
 
-#index = faiss.IndexFlatL2(dim)
+# 公開中のインデックスに新しい記事を追加し、期間外になった記事を削除する
+def incremental_update():
+    manifest = vector_index.read_manifest()
+    watermark = manifest.get("watermark") if manifest else None
+    if not watermark or watermark.get("max_article_id") is None:
+        print("差分更新に必要な前回の登録位置がないため、全件から作り直します。")
+        return full_rebuild()
 
-index = faiss.IndexHNSWFlat(dim, 32)  # 32はHNSWのネイバー数
-index.hnsw.efSearch = 64  # 検索時の探索範囲を設定
+    index, manifest = vector_index.load_current_index()
+    print(f"version: {manifest['version']} のインデックスに差分を反映します（前回の最終記事ID: {watermark['max_article_id']}）。")
 
-index.add(embeddings_np)
-print("登録されたベクトル数:", index.ntotal)
+    # 前回以降に作成された記事だけをベクトル化する
+    article_list = read_articles(after_id=watermark["max_article_id"])
+    article_ids, embeddings = embed_articles(article_list)
 
-save_dir = os.path.abspath("index_data")  # 絶対パスを取得
-os.makedirs(save_dir, exist_ok=True)  # ディレクトリを作成（存在しない場合）
+    # 対象期間から外れた記事を削除対象にする
+    window_ids = read_window_article_ids()
+    window_id_set = set(window_ids)
+    expired_ids = [article_id for article_id in indexed_article_ids(index) if article_id not in window_id_set]
 
-index_path = os.path.join(save_dir, "faiss_index.faiss")
+    evicted = embedding_cache.evict_except(window_ids)
+    print(f"{embedding_cache.report()}, 削除 {evicted} 件")
+    print(f"追加する記事: {len(article_ids)} 件, 削除する記事: {len(expired_ids)} 件")
 
-# FAISS インデックスを保存
-faiss.write_index(index, index_path)
-print(f"FAISS インデックスをに保存しました。")
\ No newline at end of file
+    if not article_ids and not expired_ids:
+        print("インデックスに変更はありません。")
+        return manifest
+
+    if expired_ids:
+        index = remove_articles(index, expired_ids)
+    if article_ids:
+        embeddings_np = np.array(embeddings).astype('float32')
+        ids_np = np.array(article_ids).astype('int64')
+        if index is None:
+            index = build_index(embeddings_np, ids_np)
+        else:
+            index.add_with_ids(embeddings_np, ids_np)
+    if index is None:
+        print("インデックスに登録できる記事がありません。")
+        return None
+    return publish(index, make_watermark(article_list, previous=watermark))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="記事の埋め込みを計算して FAISS インデックスを公開する")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="差分更新ではなく、対象期間の全記事からインデックスを作り直す"
+    )
+    args = parser.parse_args()
+    if args.full:
+        full_rebuild()
+    else:
+        incremental_update()
+    print(embedder.report())
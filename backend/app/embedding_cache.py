@@ -0,0 +1,146 @@
+import hashlib
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# IN 句1回あたりの件数
+CHUNK_SIZE = 500
+
+CREATE_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS embedding_cache ("
+    " model VARCHAR(64) NOT NULL,"
+    " text_hash CHAR(64) NOT NULL,"
+    " article_id INT NOT NULL,"
+    " embedding MEDIUMBLOB NOT NULL,"
+    " created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+    " PRIMARY KEY (model, text_hash, article_id),"
+    " KEY idx_embedding_cache_article (article_id)"
+    ") DEFAULT CHARSET=utf8mb4"
+)
+
+
+def text_hash(text: str) -> str:
+    """
+    前処理済みテキスト（preprocess_text の出力）のハッシュ
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _chunks(items: List, size: int = CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class EmbeddingCache:
+    """
+    モデル名 + テキストハッシュをキーに埋め込みベクトルを保存する永続キャッシュ（embedding_cache テーブル）
+    ベクトルは float32 のバイト列として保存する。
+    """
+
+    def __init__(self, get_connection: Callable, model: str):
+        self.get_connection = get_connection
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._ensure_table()
+
+    def _ensure_table(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(CREATE_TABLE_SQL)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        キャッシュ済みのベクトルを {text_hash: ベクトル} で返す（ヒット・ミス数も数える）
+        """
+        unique_hashes = list(dict.fromkeys(hashes))
+        found = {}
+        if unique_hashes:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                for chunk in _chunks(unique_hashes):
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    cursor.execute(
+                        "SELECT text_hash, embedding FROM embedding_cache "
+                        f"WHERE model = %s AND text_hash IN ({placeholders})",
+                        (self.model, *chunk)
+                    )
+                    for hash_value, blob in cursor.fetchall():
+                        found[hash_value] = np.frombuffer(blob, dtype="float32")
+            finally:
+                cursor.close()
+                conn.close()
+        self.hits += len(found)
+        self.misses += len(unique_hashes) - len(found)
+        return found
+
+    def put_many(self, items: List[Tuple[str, int, List[float]]]):
+        """
+        (text_hash, article_id, ベクトル) を保存する
+        同じ記事の古いテキストのエントリは置き換える
+        """
+        if not items:
+            return
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            for chunk in _chunks(items):
+                # テキストが変わった記事の古いエントリを削除
+                conditions = " OR ".join(["(article_id = %s AND text_hash <> %s)"] * len(chunk))
+                params = [self.model]
+                for hash_value, article_id, _ in chunk:
+                    params.extend([article_id, hash_value])
+                cursor.execute(
+                    f"DELETE FROM embedding_cache WHERE model = %s AND ({conditions})",
+                    tuple(params)
+                )
+                cursor.executemany(
+                    "INSERT INTO embedding_cache (model, text_hash, article_id, embedding) "
+                    "VALUES (%s, %s, %s, %s) "
+                    "ON DUPLICATE KEY UPDATE embedding = VALUES(embedding)",
+                    [
+                        (self.model, hash_value, article_id, np.asarray(vector, dtype="float32").tobytes())
+                        for hash_value, article_id, vector in chunk
+                    ]
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def evict_except(self, article_ids: Iterable[int]) -> int:
+        """
+        article_ids 以外（インデックス対象期間から外れた記事）のエントリを削除し、削除件数を返す
+        """
+        keep_ids = list(dict.fromkeys(article_ids))
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if keep_ids:
+                placeholders = ", ".join(["%s"] * len(keep_ids))
+                cursor.execute(
+                    f"DELETE FROM embedding_cache WHERE model = %s AND article_id NOT IN ({placeholders})",
+                    (self.model, *keep_ids)
+                )
+            else:
+                cursor.execute("DELETE FROM embedding_cache WHERE model = %s", (self.model,))
+            evicted = cursor.rowcount
+            conn.commit()
+            return evicted
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def report(self) -> str:
+        return f"埋め込みキャッシュ: ヒット {self.hits} 件, ミス {self.misses} 件"
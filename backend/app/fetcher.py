@@ -0,0 +1,236 @@
+import os
+import time
+import asyncio
+import threading
+import contextlib
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+import httpx
+
+try:
+    import h2  # noqa: F401  HTTP/2 は h2 がインストールされている場合だけ使う
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+#############################################################
+# クロール用の共通 HTTP クライアント（page_store.py・getdate.py・sitemap_discovery.py で使う）
+#
+# - 接続はプールして keep-alive で使い回す（HTTP/2 は h2 があれば有効、gzip / brotli は httpx が展開する）
+# - ドメインごとに同時接続数の上限と、リクエスト間隔（robots.txt の Crawl-delay があればそちらを優先）を守る
+# - robots.txt はドメインごとに ROBOTS_TTL 秒キャッシュし、禁止されたURLは取得しない
+#
+# robots.txt のキャッシュとドメインごとの次のリクエスト時刻はモジュールの politeness 1つにまとめ、
+# 同じプロセスの Fetcher・AsyncFetcher（screen_urls が呼び出しごとに作るものも含む）で共有する。
+# 記録はプロセスごとなので、クロールワーカーを N 個起動すると1ドメインへの間隔は最短で FETCH_CRAWL_DELAY / N 秒になる。
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/115.0.0.0 Safari/537.36"
+)
+HEADERS = {"User-Agent": USER_AGENT}
+
+# 1ドメインに同時に送るリクエスト数の上限
+PER_DOMAIN_CONCURRENCY = int(os.getenv("FETCH_PER_DOMAIN_CONCURRENCY", "2"))
+# 同じドメインへのリクエストの最小間隔（秒）
+CRAWL_DELAY_SECONDS = float(os.getenv("FETCH_CRAWL_DELAY", "1.0"))
+# 全体の接続数の上限
+MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "100"))
+# robots.txt のキャッシュ期間（秒）
+ROBOTS_TTL_SECONDS = float(os.getenv("ROBOTS_TTL", str(24 * 60 * 60)))
+TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+
+class RobotsDisallowed(Exception):
+    """
+    robots.txt で取得が禁止されているURL
+    """
+
+
+def _domain(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def _robots_url(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+
+
+def _parse_robots(response: Optional[httpx.Response]) -> RobotFileParser:
+    """
+    urllib.robotparser.RobotFileParser.read と同じ規則で robots.txt を解釈する
+    （401/403 は全て禁止、それ以外のエラーと取得失敗は全て許可）
+    """
+    parser = RobotFileParser()
+    if response is None:
+        parser.allow_all = True
+    elif response.status_code in (401, 403):
+        parser.disallow_all = True
+    elif response.status_code >= 400:
+        parser.allow_all = True
+    else:
+        parser.parse(response.text.splitlines())
+    parser.modified()
+    return parser
+
+
+def _client_options() -> dict:
+    return {
+        "headers": HEADERS,
+        "timeout": TIMEOUT,
+        "limits": httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS // 5),
+        "follow_redirects": True,
+        "http2": HTTP2_AVAILABLE,
+    }
+
+
+class _Politeness:
+    """
+    ドメインごとの robots.txt とリクエスト間隔の記録（同期・非同期の両方から使う）
+    """
+
+    def __init__(self, crawl_delay: float):
+        self.crawl_delay = crawl_delay
+        self._robots: Dict[str, RobotFileParser] = {}
+        self._next_request_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def cached_robots(self, domain: str) -> Optional[RobotFileParser]:
+        with self._lock:
+            parser = self._robots.get(domain)
+        if parser is None or time.time() - parser.mtime() > ROBOTS_TTL_SECONDS:
+            return None
+        return parser
+
+    def store_robots(self, domain: str, parser: RobotFileParser):
+        with self._lock:
+            self._robots[domain] = parser
+
+    def reserve_slot(self, domain: str, robots: RobotFileParser) -> float:
+        """
+        次にこのドメインへリクエストしてよい時刻を予約し、それまでの待ち時間（秒）を返す
+        """
+        delay = max(self.crawl_delay, float(robots.crawl_delay(USER_AGENT) or 0))
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_request_at.get(domain, now))
+            self._next_request_at[domain] = start_at + delay
+        return start_at - now
+
+
+# プロセス内の全ての Fetcher・AsyncFetcher で共有する robots.txt とリクエスト間隔の記録
+politeness = _Politeness(CRAWL_DELAY_SECONDS)
+
+
+class Fetcher:
+    """
+    同期版（スレッドから並行に呼び出してよい）
+    """
+
+    def __init__(self, per_domain_concurrency: int = PER_DOMAIN_CONCURRENCY, politeness: _Politeness = politeness):
+        self.per_domain_concurrency = per_domain_concurrency
+        self._client = httpx.Client(**_client_options())
+        self._politeness = politeness
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, domain: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if domain not in self._semaphores:
+                self._semaphores[domain] = threading.BoundedSemaphore(self.per_domain_concurrency)
+            return self._semaphores[domain]
+
+    def robots(self, url: str) -> RobotFileParser:
+        domain = _domain(url)
+        parser = self._politeness.cached_robots(domain)
+        if parser is None:
+            try:
+                response = self._client.get(_robots_url(url))
+            except httpx.HTTPError:
+                response = None
+            parser = _parse_robots(response)
+            self._politeness.store_robots(domain, parser)
+        return parser
+
+    @contextlib.contextmanager
+    def _turn(self, url: str):
+        robots = self.robots(url)
+        if not robots.can_fetch(USER_AGENT, url):
+            raise RobotsDisallowed(url)
+        domain = _domain(url)
+        with self._semaphore(domain):
+            wait = self._politeness.reserve_slot(domain, robots)
+            if wait > 0:
+                time.sleep(wait)
+            yield
+
+    def get(self, url: str) -> httpx.Response:
+        with self._turn(url):
+            return self._client.get(url)
+
+    @contextlib.contextmanager
+    def stream(self, url: str):
+        """
+        レスポンス本文を少しずつ読むための get（大きなサイトマップ用）
+        """
+        with self._turn(url):
+            with self._client.stream("GET", url) as response:
+                yield response
+
+    def close(self):
+        self._client.close()
+
+
+class AsyncFetcher:
+    """
+    非同期版（1つのイベントループの中で使う）
+    """
+
+    def __init__(self, per_domain_concurrency: int = PER_DOMAIN_CONCURRENCY, politeness: _Politeness = politeness):
+        self.per_domain_concurrency = per_domain_concurrency
+        self._client = httpx.AsyncClient(**_client_options())
+        self._politeness = politeness
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+
+    async def robots(self, url: str) -> RobotFileParser:
+        domain = _domain(url)
+        # 同じドメインの robots.txt を同時に何度も取得しないよう、ドメインごとに1つずつ取得する
+        lock = self._robots_locks.setdefault(domain, asyncio.Lock())
+        async with lock:
+            parser = self._politeness.cached_robots(domain)
+            if parser is None:
+                try:
+                    response = await self._client.get(_robots_url(url))
+                except httpx.HTTPError:
+                    response = None
+                parser = _parse_robots(response)
+                self._politeness.store_robots(domain, parser)
+        return parser
+
+    async def get(self, url: str) -> httpx.Response:
+        robots = await self.robots(url)
+        if not robots.can_fetch(USER_AGENT, url):
+            raise RobotsDisallowed(url)
+        domain = _domain(url)
+        semaphore = self._semaphores.setdefault(domain, asyncio.Semaphore(self.per_domain_concurrency))
+        async with semaphore:
+            wait = self._politeness.reserve_slot(domain, robots)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            return await self._client.get(url)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+# 同期処理で共有する Fetcher（プロセス内で接続と robots.txt のキャッシュを使い回す）
+fetcher = Fetcher()
@@ -1,9 +1,14 @@
+import os
 import sys
-import requests
+import asyncio
 import json
+from dataclasses import dataclass
+from typing import List, Optional
 from bs4 import BeautifulSoup
 from dateutil.parser import isoparse
 import datetime
+import page_store
+from fetcher import AsyncFetcher, RobotsDisallowed
 
 def get_published_date_ldjson(soup):
     published_date = None
@@ -52,58 +57,112 @@ def get_published_date_from_meta(soup):
                     published_date = meta_mod.get("content")
     return published_date
 
-def check_article_publication(url: str):
+# 公開からこの日数以内の記事を「新しい記事」とみなす
+RECENT_DAYS = 3
+# 非同期で同時に取得するURL数の上限（ドメインごとの上限は fetcher.py で別に守る）
+SCREEN_CONCURRENCY = int(os.getenv("DATE_CHECK_CONCURRENCY", "20"))
+
+@dataclass
+class PublicationCheck:
+    url: str
+    is_recent: bool
+    published_date: Optional[str] = None  # "YYYY-MM-DDTHH:MM"（取得できなければ None）
+    error: Optional[str] = None
+    retryable: bool = False  # 通信エラーや 5xx などの一時的な失敗（時間を置けば確認できる可能性がある）
+
+def extract_published_date(html) -> Optional[str]:
     """
-    指定したURLの記事の公開日時を抽出し、
-    その記事が現在（今日）から過去3日以内であれば(True, "YYYY-MM-DDTHH:MM")、
-    それより古い場合は(False, "YYYY-MM-DDTHH:MM")を返します。
-    公開日時の抽出に失敗した場合は(False, "情報なし")を返します。
+    HTMLから公開日時の文字列を抽出する（優先順：ld+json > <time> > meta）
     """
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/115.0.0.0 Safari/537.36"
-        )
-    }
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-    except Exception as e:
-        print("URL取得エラー:", e)
-        return False, "情報なし"
-    
-    soup = BeautifulSoup(response.content, "html.parser")
-    
-    # 公開日時の抽出（優先順：ld+json > <time> > meta）
+    soup = BeautifulSoup(html, "html.parser")
     published_date = get_published_date_ldjson(soup)
     if not published_date:
         published_date = get_published_date_from_time(soup)
     if not published_date:
         published_date = get_published_date_from_meta(soup)
-    
+    return published_date
+
+def normalize_published_date(published_date: Optional[str]) -> Optional[str]:
+    """
+    抽出した公開日時の文字列を "YYYY-MM-DDTHH:MM" に揃える（解析できなければ None）
+    """
     if not published_date:
-        return False, "情報なし"
-    
+        return None
+    try:
+        return isoparse(published_date).replace(tzinfo=None).strftime("%Y-%m-%dT%H:%M")
+    except Exception:
+        return None
+
+def judge_publication(url: str, published_date: Optional[str]) -> PublicationCheck:
+    """
+    抽出した公開日時が現在から RECENT_DAYS 日以内かどうかを判定する
+    """
+    if not published_date:
+        return PublicationCheck(url, False, error="公開日時が見つかりませんでした")
     try:
         dt = isoparse(published_date)
         # タイムゾーン情報を削除して、offset-naiveにする
         dt = dt.replace(tzinfo=None)
         formatted_date = dt.strftime("%Y-%m-%dT%H:%M")
     except Exception as e:
-        print("日付のパースに失敗しました:", e)
-        return False, "情報なし"
-    
+        return PublicationCheck(url, False, error=f"日付のパースに失敗しました: {e}")
+
     now = datetime.datetime.now()
     # 未来の日付はFalseで返す
     if dt > now:
-        return False, formatted_date
-    
-    # 現在から3日以内かどうかを判定
-    if dt >= now - datetime.timedelta(days=3):
-        return True, formatted_date
-    else:
-        return False, formatted_date
+        return PublicationCheck(url, False, formatted_date)
+    # 現在から RECENT_DAYS 日以内かどうかを判定
+    return PublicationCheck(url, dt >= now - datetime.timedelta(days=RECENT_DAYS), formatted_date)
+
+def check_article_publication(url: str):
+    """
+    指定したURLの記事の公開日時を抽出し、
+    その記事が現在（今日）から過去3日以内であれば(True, "YYYY-MM-DDTHH:MM")、
+    それより古い場合は(False, "YYYY-MM-DDTHH:MM")を返します。
+    公開日時の抽出に失敗した場合は(False, "情報なし")を返します。
+    """
+    try:
+        page = page_store.fetch(url)
+    except Exception as e:
+        print("URL取得エラー:", e)
+        return False, "情報なし"
+    if not page.ok:
+        print("URL取得エラー: HTTP", page.status_code)
+        return False, "情報なし"
+
+    result = judge_publication(url, extract_published_date(page.body))
+    if result.error:
+        print(result.error)
+    return result.is_recent, result.published_date or "情報なし"
+
+async def check_article_publication_async(async_fetcher: AsyncFetcher, url: str) -> PublicationCheck:
+    """
+    check_article_publication の非同期版（接続は async_fetcher で使い回す）
+    取得したページは page_store に保存され、web_Acquisition.py の本文取得でそのまま使われる。
+    """
+    try:
+        page = await page_store.fetch_async(async_fetcher, url)
+    except RobotsDisallowed as e:
+        return PublicationCheck(url, False, error=f"robots.txt で取得が禁止されています: {e}")
+    except Exception as e:
+        return PublicationCheck(url, False, error=f"URL取得エラー: {e}", retryable=True)
+    if not page.ok:
+        retryable = page.status_code >= 500 or page.status_code == 429
+        return PublicationCheck(url, False, error=f"URL取得エラー: HTTP {page.status_code}", retryable=retryable)
+    # HTML の解析はCPU処理なので、他のURLの取得を止めないよう別スレッドで行う
+    published_date = await asyncio.to_thread(extract_published_date, page.body)
+    return judge_publication(url, published_date)
+
+async def screen_urls(urls: List[str], concurrency: int = SCREEN_CONCURRENCY) -> List[PublicationCheck]:
+    """
+    複数のURLの公開日時を同時に最大 concurrency 件ずつ確認し、入力と同じ順序で結果を返す
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    async with AsyncFetcher() as async_fetcher:
+        async def check(url: str) -> PublicationCheck:
+            async with semaphore:
+                return await check_article_publication_async(async_fetcher, url)
+        return await asyncio.gather(*(check(url) for url in urls))
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
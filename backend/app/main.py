@@ -9,12 +9,19 @@ import datetime
 import json
 import os
 from . import auth
+from . import vector_index
+from . import db
+from .article_store import ArticleMetadataStore
+from .recommend_cache import RecommendationCache
+from .read_sets import ReadSetStore
 import faiss
 from openai import OpenAI
 import openai
+import asyncio
+import aiomysql
 from dotenv import load_dotenv
 import numpy as np
-from typing import Any
+from typing import Any, Optional
 
 #############################################################
 # 初期設定
@@ -53,98 +60,142 @@ llm = ChatOpenAI(
     openai_api_key=key
 )
 
-# FAISSインデックスのファイルパス（事前に構築済みのものを読み込む）
-index = faiss.read_index("/app/app/index_data/faiss_index.faiss")
+# 記事メタデータ（/TopPage で返す列だけを ID 指定で取得し、LRU に保持する）
+article_metadata = ArticleMetadataStore()
+
+# /TopPage で返す記事数
+RECOMMEND_PAGE_SIZE = 10
+
+# ユーザーごとの既読記事ID（検索時に除外する）
+read_sets = ReadSetStore()
+
+# ユーザーごとの推薦結果（アンケート・インデックスが変わるまで再利用する）
+recommendation_cache = RecommendationCache()
+
+# FAISSインデックス（事前に構築済みのものを読み込み、新しいバージョンが公開されたら差し替える）
+# 読み込めない場合（旧形式のインデックスしかない場合など）も API は起動し、/TopPage だけが 503 を返す。
+# embedd.py --full で新しいバージョンが公開されると、監視スレッドが読み込む。
+index_holder = vector_index.IndexHolder()
+index_holder.add_reload_listener(lambda manifest: recommendation_cache.clear())
+try:
+    index_holder.load()
+except Exception as e:
+    index_holder.last_error = str(e)
+    print(f"FAISS インデックスを読み込めませんでした。/TopPage は利用できません: {e}")
+
+@app.on_event("startup")
+def start_index_watcher():
+    index_holder.start_watcher()
+
+@app.on_event("startup")
+def create_tables():
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            for statement in CREATE_TABLE_STATEMENTS:
+                cursor.execute(statement)
+            conn.commit()
+        finally:
+            cursor.close()
+
+@app.on_event("shutdown")
+async def close_resources():
+    index_holder.stop_watcher()
+    await db.close_async_pool()
 
 #############################################################
 # データベース関係
 
-def get_db_connection():
-    try:
-        conn = mysql.connector.connect(
-            host="db",  # docker-composeの場合、MySQLコンテナのサービス名
-            user="user",
-            password="password",
-            database="db",
-            use_unicode = True,
-            charset="utf8mb4",
-            buffered=True
-        )
-        return conn
-    except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database connection error: {err}")
+# API が起動時に作成するテーブル（存在しなければ）
+CREATE_TABLE_STATEMENTS = [
+    # アンケートから抽出したジャンルキーワードとその埋め込み（survey の行ごと）
+    "CREATE TABLE IF NOT EXISTS survey_keywords ("
+    " survey_id INT NOT NULL PRIMARY KEY,"
+    " userid INT NOT NULL,"
+    " genre_keywords TEXT NOT NULL,"
+    " keywords_embedding MEDIUMBLOB NOT NULL,"
+    " created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+    " KEY idx_survey_keywords_userid (userid)"
+    ") DEFAULT CHARSET=utf8mb4",
+    # ユーザーの興味ベクトル（アンケートのキーワード埋め込みから始め、既読記事の埋め込みで更新する）
+    "CREATE TABLE IF NOT EXISTS user_interest ("
+    " user_id INT NOT NULL PRIMARY KEY,"
+    " interest_vector MEDIUMBLOB NOT NULL,"
+    " read_count INT NOT NULL DEFAULT 0,"
+    " updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"
+    ") DEFAULT CHARSET=utf8mb4",
+]
+
+# 既読記事1件で興味ベクトルをどれだけ既読記事側に寄せるか（指数移動平均の重み）
+INTEREST_BLEND_WEIGHT = float(os.getenv("INTEREST_BLEND_WEIGHT", "0.2"))
 
 # user_id取得
 def get_user_id(gmail: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = "SELECT id FROM account WHERE gmail = (%s)"
-        cursor.execute(query, (gmail,))
-        user_id = cursor.fetchone()
-        return user_id
-    except mysql.connector.Error as err:
-        print(f"Error getting user_id: {err}")
-        return -1
-    finally:
-        cursor.close()
-        conn.close()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "SELECT id FROM account WHERE gmail = (%s)"
+            cursor.execute(query, (gmail,))
+            user_id = cursor.fetchone()
+            return user_id
+        except mysql.connector.Error as err:
+            print(f"Error getting user_id: {err}")
+            return -1
+        finally:
+            cursor.close()
 
 # gmail取得
 def get_gmail(user_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = "SELECT id, gmail FROM account WHERE id = (%s)"
-        cursor.execute(query, (user_id,))
-        account = cursor.fetchone()
-        return account
-    except mysql.connector.Error as err:
-        print(f"Error getting gmail: {err}")
-        return -1
-    finally:
-        cursor.close()
-        conn.close()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "SELECT id, gmail FROM account WHERE id = (%s)"
+            cursor.execute(query, (user_id,))
+            account = cursor.fetchone()
+            return account
+        except mysql.connector.Error as err:
+            print(f"Error getting gmail: {err}")
+            return -1
+        finally:
+            cursor.close()
 
 # gmail挿入
 def insert_gmail(gmail: str):
-    # データベース接続の取得
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        # パラメータ化されたクエリで安全にINSERT処理
-        query = "INSERT INTO account (gmail) VALUES (%s)"
-        cursor.execute(query, (gmail,))
-        conn.commit()
-        inserted_id = cursor.lastrowid
-        print(f"Inserted record with ID: {inserted_id}")
-        return inserted_id
-    except mysql.connector.Error as err:
-        conn.rollback()
-        print(f"Error inserting gmail: {err}")
-        return None
-    finally:
-        cursor.close()
-        conn.close()
+    # プールからデータベース接続を取得
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # パラメータ化されたクエリで安全にINSERT処理
+            query = "INSERT INTO account (gmail) VALUES (%s)"
+            cursor.execute(query, (gmail,))
+            conn.commit()
+            inserted_id = cursor.lastrowid
+            print(f"Inserted record with ID: {inserted_id}")
+            return inserted_id
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error inserting gmail: {err}")
+            return None
+        finally:
+            cursor.close()
 
 # ログ挿入
 def insert_read_log(user_id: int, article_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = "INSERT INTO read_log (user_id, article_id) VALUES (%s, %s)"
-        cursor.execute(query, (user_id, article_id))
-        conn.commit()
-        inserted_id = cursor.lastrowid
-        print(f"Inserted read_log with ID: {inserted_id}")
-        return inserted_id
-    except mysql.connector.Error as err:
-        conn.rollback()
-        print(f"Error inserting read_log: {err}")
-        return None
-    finally:
-        cursor.close()
-        conn.close()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "INSERT INTO read_log (user_id, article_id) VALUES (%s, %s)"
+            cursor.execute(query, (user_id, article_id))
+            conn.commit()
+            inserted_id = cursor.lastrowid
+            print(f"Inserted read_log with ID: {inserted_id}")
+            return inserted_id
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error inserting read_log: {err}")
+            return None
+        finally:
+            cursor.close()
 
 class BlogPostSchema(BaseModel):
     id: int
@@ -177,12 +228,13 @@ class ReadLogIn(BaseModel):
     article_id: int
 
 # Pydanticモデル（出力用）
+# content などの列は ARTICLE_COLUMNS で取得対象から外せる
 class RecommendArticle(BaseModel):
     id: int
     title: str
     summary150: str
     summary1000: str
-    content: str
+    content: Optional[str] = None
     url: str
     published_date: str
     created_at: str
@@ -211,30 +263,6 @@ class Browsing_History(BaseModel):
 #############################################################
 
 # ユーザーごとにレコメンドするエンドポイント
-def read_articles():
-    """
-    DBから記事情報を取得して、各行の日時をISO形式に変換し、リスト(dict)で返す
-    """
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, title, summary150, summary1000, content, url, published_date, created_at "
-            "FROM article ORDER BY published_date DESC"
-        )
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-    except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database query error: {err}")
-    
-    for row in rows:
-        if isinstance(row.get("created_at"), (datetime.date, datetime.datetime)):
-            row["created_at"] = row["created_at"].isoformat()
-        if isinstance(row.get("published_date"), (datetime.date, datetime.datetime)):
-            row["published_date"] = row["published_date"].isoformat()
-    return rows
-
 def get_embedding(text, model="text-embedding-ada-002"):
     """
     OpenAI APIを使って、テキストの埋め込みベクトルを取得
@@ -254,32 +282,142 @@ def get_combined_embedding(keywords):
     combined_embedding = np.mean(embeddings, axis=0)  # 平均をとる
     return combined_embedding.astype('float32')
 
-def search_articles(query_text, k=10):
+async def search_articles_by_vector(query_embedding, k=10, exclude_ids=None):
     """
-    query_textから埋め込みを生成し、FAISSインデックスから上位 k 件を返す
+    埋め込みベクトルで FAISSインデックスを検索し、exclude_ids を除いた上位 k 件の距離と article.id を返す
     """
-    query_embedding = get_embedding(query_text)
     query_np = np.array([query_embedding]).astype('float32')
 
-    distances, indices = index.search(query_np, k)
-    return distances[0], indices[0]
+    # FAISS の検索はCPU処理なので、イベントループを止めないよう別スレッドで実行する
+    distances, article_ids = await asyncio.to_thread(index_holder.search, query_np, k, exclude_ids)
+    return distances[0], article_ids[0]
 
-def browsing_log(user_id):
+# ユーザーのアンケートと、事前に抽出したジャンルキーワード・その埋め込み、興味ベクトルを取得する関数
+async def get_survey_keywords(user_id: int) -> dict:
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        # [CHANGED] SQL文にスペースとWHERE句を追加し、user_idでフィルタリングするように変更
-        query = (
-            "SELECT user_id, article_id FROM read_log WHERE user_id = %s"           # ※[CHANGED] user_idでフィルタリングするためWHERE句を追加
-        )
-        cursor.execute(query, (user_id,))
-        rows = cursor.fetchall()  # [CHANGED] 「fechall()」のタイポを修正
-        cursor.close()
-        conn.close()
-        print("browsing_log rows:", rows)
-        return rows
-    except mysql.connector.Error as err:
-        raise Exception(f"Database query error: {err}")
+        async with db.async_connection() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                query = (
+                    "SELECT survey.id AS survey_id, survey.preferred_article_detail, "
+                    "survey_keywords.genre_keywords, survey_keywords.keywords_embedding, "
+                    "user_interest.interest_vector "
+                    "FROM survey LEFT JOIN survey_keywords ON survey_keywords.survey_id = survey.id "
+                    "LEFT JOIN user_interest ON user_interest.user_id = survey.userid "
+                    "WHERE survey.userid = %s"
+                )
+                await cursor.execute(query, (user_id,))
+                row = await cursor.fetchone()
+    except aiomysql.Error as err:
+        raise HTTPException(status_code=500, detail=f"Database query error: {err}")
+    if row and row.get("preferred_article_detail"):
+        return row
+    else:
+        raise HTTPException(status_code=404, detail="User survey data not found")
+
+# ユーザーの好みからジャンルキーワードを抽出し、その埋め込みと一緒に返す関数
+def extract_genre_keywords(preferred_article_detail: str):
+    # LLMに好みからジャンルキーワードのみ抽出させる
+    messages = [
+        SystemMessage(content="あなたは、ユーザーの好みの文章から関連するジャンルキーワードを抽出するアシスタントです。"),
+        HumanMessage(content=f"{preferred_article_detail}に関連、または含まれるジャンルの単語のみを出力して。")
+    ]
+    llm_response = llm.invoke(messages)  # ここでLLMが応答
+    genre_keywords = llm_response.content.strip()  # 例: "技術, AI, IoT"
+    print("抽出されたジャンルキーワード:", genre_keywords)
+    keywords_embedding = np.array(get_embedding(genre_keywords)).astype('float32')
+    return genre_keywords, keywords_embedding
+
+# 抽出したジャンルキーワードと埋め込みを survey_keywords テーブルに保存する関数
+def store_survey_keywords(survey_id: int, user_id: int, genre_keywords: str, keywords_embedding):
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = (
+                "INSERT INTO survey_keywords (survey_id, userid, genre_keywords, keywords_embedding) "
+                "VALUES (%s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE genre_keywords = VALUES(genre_keywords), "
+                "keywords_embedding = VALUES(keywords_embedding)"
+            )
+            cursor.execute(query, (survey_id, user_id, genre_keywords, keywords_embedding.tobytes()))
+            conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error storing survey keywords: {err}")
+        finally:
+            cursor.close()
+
+# アンケートからジャンルキーワードを抽出して保存する（アンケート登録時、または未保存時に1回だけ実行）
+# 興味ベクトルが未作成なら、キーワードの埋め込みを初期値として保存する
+def precompute_survey_keywords(survey_id: int, user_id: int, preferred_article_detail: str):
+    genre_keywords, keywords_embedding = extract_genre_keywords(preferred_article_detail)
+    store_survey_keywords(survey_id, user_id, genre_keywords, keywords_embedding)
+    init_user_interest(user_id, keywords_embedding)
+    return genre_keywords, keywords_embedding
+
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+# 興味ベクトルの初期値を保存する関数（すでにある場合は何もしない）
+def init_user_interest(user_id: int, vector):
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "INSERT IGNORE INTO user_interest (user_id, interest_vector) VALUES (%s, %s)"
+            cursor.execute(query, (user_id, _normalize(vector).astype('float32').tobytes()))
+            conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error initializing user interest: {err}")
+        finally:
+            cursor.close()
+
+# 既読記事の埋め込みを興味ベクトルに混ぜる関数（指数移動平均）
+def update_user_interest(user_id: int, article_id: int):
+    # 記事の埋め込みは FAISS インデックスから取り出す（OpenAI は呼ばない）
+    article_vector = index_holder.reconstruct(article_id)
+    if article_vector is None:
+        print(f"記事ID {article_id} がインデックスにないため、興味ベクトルは更新しません。")
+        return
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "SELECT interest_vector FROM user_interest WHERE user_id = %s FOR UPDATE"
+            cursor.execute(query, (user_id,))
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return
+            current = np.frombuffer(row[0], dtype='float32')
+            blended = _normalize(
+                (1 - INTEREST_BLEND_WEIGHT) * current + INTEREST_BLEND_WEIGHT * _normalize(article_vector)
+            ).astype('float32')
+            query = (
+                "UPDATE user_interest SET interest_vector = %s, read_count = read_count + 1 "
+                "WHERE user_id = %s"
+            )
+            cursor.execute(query, (blended.tobytes(), user_id))
+            conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error updating user interest: {err}")
+        finally:
+            cursor.close()
+
+# ユーザーの検索クエリとなる埋め込みを取得する関数
+# 興味ベクトルがあればそれをそのまま使い（OpenAI を呼ばない）、なければジャンルキーワードの埋め込みを使う
+async def get_query_embedding(user_id: int):
+    survey = await get_survey_keywords(user_id)
+    if survey.get("interest_vector") is not None:
+        return np.frombuffer(survey["interest_vector"], dtype='float32')
+    if survey.get("keywords_embedding") is not None:
+        print("保存済みのジャンルキーワード:", survey["genre_keywords"])
+        return np.frombuffer(survey["keywords_embedding"], dtype='float32')
+    print("ジャンルキーワードが未保存のため抽出します。ユーザーの好み:", survey["preferred_article_detail"])
+    _, keywords_embedding = await asyncio.to_thread(
+        precompute_survey_keywords, survey["survey_id"], user_id, survey["preferred_article_detail"]
+    )
+    return keywords_embedding
 
 
 #############################################################
@@ -298,74 +436,44 @@ def register_account(account: AccountIn):
 
 # /recommend エンドポイント
 @app.get("/TopPage", response_model=list[RecommendArticle])
-def recommend(current_user: Any = Depends(auth.get_current_user)):
+async def recommend(current_user: Any = Depends(auth.get_current_user)):
     if not current_user:
         print("ユーザーの取得に失敗しました")
         raise HTTPException(status_code=401, detail="Not authenticated")
     # current_userからユーザーIDを取得（get_gmailの戻り値に合わせる）
     user_id = current_user[0]
-    
-    # survey テーブルからユーザーの好みを取得する関数
-    def get_user_preference(user_id: int) -> str:
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            query = "SELECT preferred_article_detail FROM survey WHERE userid = %s"
-            cursor.execute(query, (user_id,))
-            row = cursor.fetchone()
-            cursor.close()
-            conn.close()
-            if row and row.get("preferred_article_detail"):
-                return row["preferred_article_detail"]
-            else:
-                raise HTTPException(status_code=404, detail="User survey data not found")
-        except mysql.connector.Error as err:
-            raise HTTPException(status_code=500, detail=f"Database query error: {err}")
 
-    # surveyテーブルから好みを取得
-    preferred_article_detail = get_user_preference(user_id)
-    print("ユーザーの好み:", preferred_article_detail)
-    
-    # LLMに好みからジャンルキーワードのみ抽出させる
-    messages = [
-        SystemMessage(content="あなたは、ユーザーの好みの文章から関連するジャンルキーワードを抽出するアシスタントです。"),
-        HumanMessage(content=f"{preferred_article_detail}に関連、または含まれるジャンルの単語のみを出力して。")
-    ]
-    llm_response = llm(messages)  # ここでLLMが応答
-    genre_keywords = llm_response.content.strip()  # 例: "技術, AI, IoT"
-    print("抽出されたジャンルキーワード:", genre_keywords)
-    print(type(genre_keywords))
+    if index_holder.index is None:
+        raise HTTPException(status_code=503, detail="Recommendation index is not available")
 
-    # ユーザーの既読記事IDを取得（browsing_log関数を呼び出す）
+    # アンケートもインデックスも変わっていなければ前回の推薦結果を返す
+    cache_key = recommendation_cache.key(user_id, index_holder.version)
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        print(f"推薦記事件数: {len(cached)}（キャッシュ）")
+        return JSONResponse(content=cached, media_type="application/json; charset=utf-8")
+
+    # 検索クエリの埋め込み（アンケート登録時に抽出済みのジャンルキーワード）と既読記事IDの取得は
+    # 互いに独立なので並行に実行する
     print(f"ユーザーID{user_id}")
-    read_log_rows = browsing_log(int(user_id))
-    read_article_ids = [row["article_id"] for row in read_log_rows]
-    print("既読の記事ID:", read_article_ids)
+    query_embedding, read_article_ids = await asyncio.gather(
+        get_query_embedding(user_id),
+        read_sets.get(int(user_id))
+    )
+    print("既読の記事数:", len(read_article_ids))
 
-    # FAISSで類似検索（上位10件）
-    distances, indices = search_articles(genre_keywords, k=10+len(read_article_ids))
-    
-    # DBから全記事を取得
-    articles = read_articles()
+    # FAISSで類似検索（上位10件）。インデックスには article.id が登録されている
+    # 既読の記事は検索時に除外するので、k は表示件数のまま
+    distances, hit_ids = await search_articles_by_vector(
+        query_embedding, k=RECOMMEND_PAGE_SIZE, exclude_ids=read_article_ids
+    )
 
+    # -1 は該当なし
+    candidate_ids = [int(article_id) for article_id in hit_ids if article_id != -1]
 
-    
-    # FAISSのインデックスは記事リストのインデックスに対応していると仮定
-    # 既読の記事は推薦リストに含めない
-    recommended = []
-    for idx in indices:
-        if idx < len(articles):
-            article = articles[idx]
-            # [CHANGED] 安全に記事IDを取得するため、キーが存在しない場合の対策を追加
-            article_id = article.get("article_id")
-            if article_id is None:
-                # もしarticle_idキーがない場合、代替キー"id"を試す
-                article_id = article.get("id")
-            if article_id is None:
-                print("Article does not have 'article_id' or 'id', skipping:", article)  # ※[CHANGED]
-                continue  # ※[CHANGED]
-            if article_id not in read_article_ids:
-                recommended.append(article)
+    # ヒットした記事のメタデータだけを取得（検索順を保持、LRU にあるものは DB に問い合わせない）
+    recommended = await article_metadata.get_many(candidate_ids)
+    recommendation_cache.put(cache_key, recommended)
     
     print(f"推薦記事件数: {len(recommended)}")
     #print(f'recommended: {recommended}')
@@ -383,11 +491,44 @@ def log_read_event(log: ReadLogIn, current_user: Any = Depends(auth.get_current_
     inserted_id = insert_read_log(user_id, log.article_id)
     if inserted_id is None:
         raise HTTPException(status_code=401, detail="Failed to insert read log")
+    # 検索時に除外する既読記事IDの集合に追加
+    read_sets.add(user_id, log.article_id)
+    # キャッシュ済みの推薦一覧からは既読記事だけを取り除く（再計算はしない）
+    recommendation_cache.remove_article(user_id, log.article_id)
+    # 既読記事を興味ベクトルに反映
+    update_user_interest(user_id, log.article_id)
     return JSONResponse(
         content={"message": "Read log recorded", "id": inserted_id},
         media_type="application/json; charset=utf-8"
     )
 
+# コネクションプールの待ち時間・使用率（プールサイズの調整用）
+@app.get("/db_pool_status")
+def db_pool_status():
+    return JSONResponse(
+        content=db.pool.stats(),
+        media_type="application/json; charset=utf-8"
+    )
+
+# 推薦結果・記事メタデータのキャッシュのヒット率
+@app.get("/cache_status")
+def cache_status():
+    return JSONResponse(
+        content={
+            "recommendation": recommendation_cache.stats(),
+            "article_metadata": article_metadata.stats(),
+        },
+        media_type="application/json; charset=utf-8"
+    )
+
+# 現在 API が使っている FAISS インデックスのバージョンとベクトル数
+@app.get("/index_status")
+def index_status():
+    return JSONResponse(
+        content=index_holder.status(),
+        media_type="application/json; charset=utf-8"
+    )
+
 # 興味のあるサイトをsource_urlテーブルに保存するエンドポイント
 @router.post("/regist_favorite_site")
 def regist_favorite_site_event(favorite: FavoriteSiteIn, current_user: Any = Depends(auth.get_current_user)):
@@ -397,34 +538,33 @@ def regist_favorite_site_event(favorite: FavoriteSiteIn, current_user: Any = Dep
     # current_userからユーザーIDを取得（get_gmailの戻り値に合わせる）
     user_id = current_user[0]
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        # まず、source_url テーブルに同じURLが存在するかチェック
-        select_query = "SELECT id FROM source_url WHERE url = %s"
-        cursor.execute(select_query, (favorite.url,))
-        result = cursor.fetchone()
-        if result:
-            source_id = result[0]
-        else:
-            # 存在しなければ、新規登録
-            insert_source = "INSERT INTO source_url (url) VALUES (%s)"
-            cursor.execute(insert_source, (favorite.url,))
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # まず、source_url テーブルに同じURLが存在するかチェック
+            select_query = "SELECT id FROM source_url WHERE url = %s"
+            cursor.execute(select_query, (favorite.url,))
+            result = cursor.fetchone()
+            if result:
+                source_id = result[0]
+            else:
+                # 存在しなければ、新規登録
+                insert_source = "INSERT INTO source_url (url) VALUES (%s)"
+                cursor.execute(insert_source, (favorite.url,))
+                conn.commit()
+                source_id = cursor.lastrowid
+
+            # 次に、favorite_sites テーブルに登録（ユーザーとsource_id の組み合わせ）
+            insert_favorite = "INSERT INTO favorite_sites (user_id, source_id) VALUES (%s, %s)"
+            cursor.execute(insert_favorite, (user_id, source_id))
             conn.commit()
-            source_id = cursor.lastrowid
-
-        # 次に、favorite_sites テーブルに登録（ユーザーとsource_id の組み合わせ）
-        insert_favorite = "INSERT INTO favorite_sites (user_id, source_id) VALUES (%s, %s)"
-        cursor.execute(insert_favorite, (user_id, source_id))
-        conn.commit()
-        favorite_id = cursor.lastrowid
+            favorite_id = cursor.lastrowid
 
-    except mysql.connector.Error as err:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        finally:
+            cursor.close()
 
     return JSONResponse(
         content={"message": "Favorite site registered", "favorite_id": favorite_id},
@@ -444,31 +584,46 @@ def regist_survey(
     # current_user は例えば (user_id, gmail) などのタプルとして取得されると仮定
     user_id = current_user[0]
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = "DELETE FROM survey WHERE userid = (%s)"
-        cursor.execute(query, (user_id,))
-        conn.commit()
-    except mysql.connector.Error as err:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Database delete error: {err}")
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "DELETE FROM survey WHERE userid = (%s)"
+            cursor.execute(query, (user_id,))
+            query = "DELETE FROM survey_keywords WHERE userid = (%s)"
+            cursor.execute(query, (user_id,))
+            # 好みが変わったので興味ベクトルも新しいアンケートから作り直す
+            query = "DELETE FROM user_interest WHERE user_id = (%s)"
+            cursor.execute(query, (user_id,))
+            conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Database delete error: {err}")
+        try:
+            query = (
+                "INSERT INTO survey (userid, age, gender, job, preferred_article_detail) "
+                "VALUES (%s, %s, %s, %s, %s)"
+            )
+            # クライアントから送信された userid は無視し、current_user の値を使用
+            values = (user_id, survey.age, survey.gender, survey.job, survey.preferred_article_detail)
+            cursor.execute(query, values)
+            conn.commit()
+            inserted_id = cursor.lastrowid
+        except mysql.connector.Error as err:
+            conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Database insert error: {err}")
+        finally:
+            cursor.close()
+
+    # 好みが変わったので推薦結果のキャッシュを破棄
+    recommendation_cache.invalidate_user(user_id)
+
+    # /TopPage のたびにLLMを呼ばないよう、ジャンルキーワードと埋め込みをここで1回だけ計算して保存する
+    # 失敗してもアンケートの登録は成功扱いにし、/TopPage で改めて計算する
     try:
-        query = (
-            "INSERT INTO survey (userid, age, gender, job, preferred_article_detail) "
-            "VALUES (%s, %s, %s, %s, %s)"
-        )
-        # クライアントから送信された userid は無視し、current_user の値を使用
-        values = (user_id, survey.age, survey.gender, survey.job, survey.preferred_article_detail)
-        cursor.execute(query, values)
-        conn.commit()
-        inserted_id = cursor.lastrowid
-    except mysql.connector.Error as err:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Database insert error: {err}")
-    finally:
-        cursor.close()
-        conn.close()
+        precompute_survey_keywords(inserted_id, user_id, survey.preferred_article_detail)
+    except Exception as e:
+        print(f"ジャンルキーワードの事前抽出に失敗しました: {e}")
+
     return JSONResponse(
         content={"message": "Survey data registered", "id": inserted_id},
         media_type="application/json; charset=utf-8"
@@ -0,0 +1,177 @@
+import os
+import re
+import hashlib
+import datetime
+import unicodedata
+from collections import Counter
+from typing import Optional, Tuple
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Index, text
+from sqlalchemy.dialects.mysql import BIGINT, SMALLINT
+from sqlalchemy.orm import declarative_base
+
+#############################################################
+# 転載・同時掲載された記事の検出（web_Acquisition.py で本文取得の直後、LLM を呼ぶ前に使う）
+#
+# 本文の文字 3-gram から 64bit の SimHash を作り、16bit ずつ4つのバンドに分けて保存する。
+# ハミング距離が MAX_DISTANCE(3) 以下の2つの SimHash は、鳩の巣原理により少なくとも1つのバンドが一致するので、
+# バンドのインデックスで候補を絞ってから距離を確かめれば取りこぼしがない。
+
+DATABASE_URL = "mysql+pymysql://user:password@db:3306/db?charset=utf8mb4"
+engine = create_engine(DATABASE_URL, echo=os.getenv("SQL_ECHO", "0") == "1", pool_pre_ping=True)
+Base = declarative_base()
+
+SHINGLE_SIZE = 3
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+# この距離以下なら同じ記事とみなす
+MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "3"))
+# 比較の対象にする既存記事の期間（日）。日時は article.created_at に合わせて UTC で扱う
+WINDOW_DAYS = int(os.getenv("NEAR_DUPLICATE_WINDOW_DAYS", "7"))
+# 正規化後の本文がこれより短い記事は判定しない（短い文章の SimHash は偶然一致しやすい）
+MIN_TEXT_CHARS = 200
+
+
+class ArticleFingerprint(Base):
+    __tablename__ = "article_fingerprint"
+    article_id = Column(Integer, primary_key=True)
+    simhash = Column(BIGINT(unsigned=True), nullable=False)
+    band0 = Column(SMALLINT(unsigned=True), nullable=False, index=True)
+    band1 = Column(SMALLINT(unsigned=True), nullable=False, index=True)
+    band2 = Column(SMALLINT(unsigned=True), nullable=False, index=True)
+    band3 = Column(SMALLINT(unsigned=True), nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
+class ArticleDuplicate(Base):
+    """
+    要約せずに既存の記事へ紐付けたURL
+    """
+    __tablename__ = "article_duplicate"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    url = Column(String(255), nullable=False, unique=True)
+    article_id = Column(Integer, nullable=False)
+    distance = Column(Integer, nullable=False)
+    detected_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_article_duplicate_detected_at", "detected_at"),
+    )
+
+
+Base.metadata.create_all(bind=engine)
+
+
+def normalize(text_value: str) -> str:
+    # 全角・半角や大文字・小文字、空白の違いで別の記事と判定されないようにする
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text_value).lower())
+
+
+def simhash(text_value: str) -> Optional[int]:
+    """
+    文字 3-gram の SimHash（判定に十分な長さがなければ None）
+    """
+    normalized = normalize(text_value)
+    if len(normalized) < MIN_TEXT_CHARS:
+        return None
+    counts = Counter(normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1))
+    weights = [0] * HASH_BITS
+    for shingle, count in counts.items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(HASH_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def bands(fingerprint: int) -> Tuple[int, ...]:
+    mask = (1 << BAND_BITS) - 1
+    return tuple(fingerprint >> (BAND_BITS * i) & mask for i in range(BANDS))
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def find_duplicate(fingerprint: int) -> Optional[Tuple[int, int]]:
+    """
+    直近 WINDOW_DAYS 日の記事から最も近い重複記事を探し、(article_id, 距離) を返す（なければ None）
+    """
+    band_values = bands(fingerprint)
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=WINDOW_DAYS)
+    conditions = " OR ".join(f"band{i} = :band{i}" for i in range(BANDS))
+    params = {f"band{i}": value for i, value in enumerate(band_values)}
+    params["since"] = since
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(f"SELECT article_id, simhash FROM article_fingerprint WHERE created_at >= :since AND ({conditions})"),
+            params,
+        ).fetchall()
+    best = None
+    for row in rows:
+        distance = hamming_distance(fingerprint, int(row.simhash))
+        if distance <= MAX_DISTANCE and (best is None or distance < best[1]):
+            best = (row.article_id, distance)
+    return best
+
+
+def store_fingerprint(article_id: int, fingerprint: int, created_at: datetime.datetime = None):
+    band_values = bands(fingerprint)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT IGNORE INTO article_fingerprint (article_id, simhash, band0, band1, band2, band3, created_at) "
+                "VALUES (:article_id, :simhash, :band0, :band1, :band2, :band3, :created_at)"
+            ),
+            {
+                "article_id": article_id,
+                "simhash": fingerprint,
+                **{f"band{i}": value for i, value in enumerate(band_values)},
+                "created_at": created_at or datetime.datetime.utcnow(),
+            },
+        )
+
+
+def link_duplicate(url: str, article_id: int, distance: int):
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT IGNORE INTO article_duplicate (url, article_id, distance, detected_at) "
+                "VALUES (:url, :article_id, :distance, :detected_at)"
+            ),
+            {"url": url, "article_id": article_id, "distance": distance, "detected_at": datetime.datetime.utcnow()},
+        )
+
+
+def backfill(days: int = WINDOW_DAYS) -> int:
+    """
+    指紋が未登録の直近の記事（この仕組みより前に保存された記事）の指紋を登録し、件数を返す
+    """
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT a.id, a.content, a.created_at FROM article a "
+                "LEFT JOIN article_fingerprint f ON f.article_id = a.id "
+                "WHERE a.created_at >= :since AND f.article_id IS NULL"
+            ),
+            {"since": since},
+        ).fetchall()
+    stored = 0
+    for row in rows:
+        fingerprint = simhash(row.content or "")
+        if fingerprint is not None:
+            store_fingerprint(row.id, fingerprint, created_at=row.created_at)
+            stored += 1
+    return stored
+
+
+def count_duplicates(hours: int = 24) -> int:
+    """
+    直近 hours 時間に既存記事へ紐付けたURLの数
+    """
+    since = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT COUNT(*) FROM article_duplicate WHERE detected_at >= :since"),
+            {"since": since},
+        ).scalar()
@@ -0,0 +1,151 @@
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from fetcher import fetcher, AsyncFetcher
+
+#############################################################
+# 取得したページのローカル保存先（getdate.py と web_Acquisition.py で共有）
+#
+# URL の SHA-256 をファイル名にして、レスポンスヘッダ（JSON 1行）と生の HTML を gzip で保存する。
+# 保存から PAGE_STORE_TTL 秒以内のページは再取得せずに保存分を使うため、
+# 1回のクロールで同じページを取得するのは1度だけになる。
+
+PAGE_STORE_DIR = os.getenv(
+    "PAGE_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "page_store")
+)
+PAGE_STORE_TTL_SECONDS = float(os.getenv("PAGE_STORE_TTL", str(24 * 60 * 60)))
+
+
+@dataclass
+class StoredPage:
+    url: str
+    status_code: int
+    body: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+    fetched_at: float = 0.0
+    from_store: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 300
+
+
+def _path_for(url: str, store_dir: str = PAGE_STORE_DIR) -> str:
+    return os.path.join(store_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".gz")
+
+
+def get(url: str, max_age: Optional[float] = PAGE_STORE_TTL_SECONDS, store_dir: str = PAGE_STORE_DIR) -> Optional[StoredPage]:
+    """
+    保存済みのページを返す（max_age 秒より古い、または未保存なら None。max_age=None なら期限を無視）
+    """
+    path = _path_for(url, store_dir)
+    try:
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+    except (FileNotFoundError, OSError, EOFError):
+        return None
+    header_line, _, body = data.partition(b"\n")
+    try:
+        meta = json.loads(header_line)
+    except json.JSONDecodeError:
+        return None
+    if max_age is not None and time.time() - meta["fetched_at"] > max_age:
+        return None
+    return StoredPage(
+        url=meta["url"],
+        status_code=meta["status_code"],
+        body=body,
+        headers=meta.get("headers", {}),
+        fetched_at=meta["fetched_at"],
+        from_store=True,
+    )
+
+
+def put(page: StoredPage, store_dir: str = PAGE_STORE_DIR):
+    """
+    ページを保存する（一時ファイルに書いてから置き換えるので、読み込み側が途中の状態を見ることはない）
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    meta = {
+        "url": page.url,
+        "status_code": page.status_code,
+        "headers": page.headers,
+        "fetched_at": page.fetched_at,
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+            f.write(b"\n")
+            f.write(page.body)
+        os.replace(tmp_path, _path_for(page.url, store_dir))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def purge(max_age: float = PAGE_STORE_TTL_SECONDS, store_dir: str = PAGE_STORE_DIR) -> int:
+    """
+    max_age 秒より古いページを削除し、削除件数を返す
+    """
+    if not os.path.isdir(store_dir):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def _remember(url: str, status_code: int, headers, body: bytes) -> StoredPage:
+    page = StoredPage(
+        url=url,
+        status_code=status_code,
+        body=body,
+        headers=dict(headers),
+        fetched_at=time.time(),
+    )
+    # 失敗したレスポンスは保存しない（次のクロールで取り直す）
+    if page.ok:
+        put(page)
+    return page
+
+
+def fetch(url: str, offline: bool = False) -> Optional[StoredPage]:
+    """
+    保存済みならそれを、なければ共有の fetcher で取得して保存したページを返す
+    offline=True のときは期限切れでも保存分を返し、ネットワークには接続しない（未保存なら None）
+    """
+    if offline:
+        return get(url, max_age=None)
+    page = get(url)
+    if page is not None:
+        return page
+    response = fetcher.get(url)
+    return _remember(url, response.status_code, response.headers, response.content)
+
+
+async def fetch_async(async_fetcher: AsyncFetcher, url: str) -> StoredPage:
+    """
+    fetch の非同期版（取得には async_fetcher を使う）
+    gzip の読み書きはイベントループを止めないよう別スレッドで行う。
+    """
+    page = await asyncio.to_thread(get, url)
+    if page is not None:
+        return page
+    response = await async_fetcher.get(url)
+    return await asyncio.to_thread(_remember, url, response.status_code, response.headers, response.content)
@@ -0,0 +1,67 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import aiomysql
+from fastapi import HTTPException
+from . import db
+
+#############################################################
+# ユーザーごとの既読記事IDの集合（FAISS の検索時に除外するために使う）
+# 各ユーザーの既読IDは重複なしでソート済みの int64 配列として保持し、/log_read で1件ずつ追加する。
+
+READ_SET_MAX_USERS = int(os.getenv("READ_SET_MAX_USERS", "10000"))
+
+
+class ReadSetStore:
+    def __init__(self, max_users: int = READ_SET_MAX_USERS):
+        self.max_users = max_users
+        self._read_ids = OrderedDict()  # user_id -> np.ndarray(int64, ソート済み)
+        self._lock = threading.Lock()
+
+    async def get(self, user_id: int) -> np.ndarray:
+        """
+        ユーザーの既読記事IDを返す（初回だけ read_log から読み込む）
+        """
+        with self._lock:
+            read_ids = self._read_ids.get(user_id)
+            if read_ids is not None:
+                self._read_ids.move_to_end(user_id)
+                return read_ids
+
+        read_ids = await self._load(user_id)
+        with self._lock:
+            # 読み込み中に /log_read で追加された分を失わないよう、既存の配列とマージする
+            current = self._read_ids.get(user_id)
+            if current is not None:
+                read_ids = np.union1d(current, read_ids)
+            self._read_ids[user_id] = read_ids
+            self._read_ids.move_to_end(user_id)
+            while len(self._read_ids) > self.max_users:
+                self._read_ids.popitem(last=False)
+            return read_ids
+
+    async def _load(self, user_id: int) -> np.ndarray:
+        try:
+            async with db.async_connection() as conn:
+                async with conn.cursor() as cursor:
+                    query = "SELECT article_id FROM read_log WHERE user_id = %s"
+                    await cursor.execute(query, (user_id,))
+                    rows = await cursor.fetchall()
+        except aiomysql.Error as err:
+            raise HTTPException(status_code=500, detail=f"Database query error: {err}")
+        return np.unique(np.array([row[0] for row in rows], dtype='int64'))
+
+    def add(self, user_id: int, article_id: int):
+        """
+        既読記事を1件追加する（まだ読み込んでいないユーザーは、次回 get で read_log から読み込む）
+        """
+        with self._lock:
+            read_ids = self._read_ids.get(user_id)
+            if read_ids is None:
+                return
+            position = np.searchsorted(read_ids, article_id)
+            if position < len(read_ids) and read_ids[position] == article_id:
+                return
+            # 配列は置き換えるので、検索中の呼び出し側が持っている配列は変わらない
+            self._read_ids[user_id] = np.insert(read_ids, position, article_id)
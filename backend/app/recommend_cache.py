@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+#############################################################
+# ユーザーごとの推薦結果キャッシュ
+# キーは (user_id, アンケートのバージョン, インデックスのバージョン)。
+# アンケートのバージョンは /regist_survey のたびに invalidate_user で進める。
+
+RECOMMEND_CACHE_SIZE = int(os.getenv("RECOMMEND_CACHE_SIZE", "1024"))
+
+
+class RecommendationCache:
+    """
+    推薦結果の LRU キャッシュ
+    /log_read では再計算せず、キャッシュ済みの一覧から既読記事を取り除く。
+    """
+
+    def __init__(self, max_entries: int = RECOMMEND_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (key, 記事一覧)
+        self._survey_versions = {}     # user_id -> アンケートのバージョン
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.patches = 0
+        self.invalidations = 0
+
+    def key(self, user_id: int, index_version: Optional[str]) -> tuple:
+        """
+        推薦の計算を始める時点のキー（計算中にアンケートやインデックスが変わっても古い結果を返さない）
+        """
+        with self._lock:
+            return (user_id, self._survey_versions.get(user_id, 0), index_version)
+
+    def get(self, key: tuple) -> Optional[List[dict]]:
+        user_id = key[0]
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == key and entry[1]:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, articles: List[dict]):
+        user_id = key[0]
+        with self._lock:
+            # 計算中にアンケートが更新された場合は保存しない
+            if key[1] != self._survey_versions.get(user_id, 0):
+                return
+            self._entries[user_id] = (key, list(articles))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def remove_article(self, user_id: int, article_id: int):
+        """
+        既読になった記事をキャッシュ済みの推薦一覧から取り除く
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            key, articles = entry
+            remaining = [article for article in articles if article.get("id") != article_id]
+            if len(remaining) != len(articles):
+                self._entries[user_id] = (key, remaining)
+                self.patches += 1
+
+    def invalidate_user(self, user_id: int):
+        """
+        アンケートが更新されたユーザーのキャッシュを破棄する
+        """
+        with self._lock:
+            self._survey_versions[user_id] = self._survey_versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+            self.invalidations += 1
+
+    def clear(self):
+        """
+        インデックスのバージョンが変わったときに全ユーザーのキャッシュを破棄する
+        """
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "patches": self.patches,
+                "invalidations": self.invalidations,
+            }
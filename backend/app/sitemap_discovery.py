@@ -0,0 +1,260 @@
+import os
+import re
+import zlib
+import calendar
+import datetime
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+import httpx
+from bs4 import BeautifulSoup
+from dateutil.parser import isoparse
+from fetcher import fetcher, RobotsDisallowed
+
+#############################################################
+# サイトマップ / RSS / Atom からの記事URLの収集（url_acquisition.py で Firecrawl の前に使う）
+#
+# robots.txt の Sitemap 行（なければ /sitemap.xml など）から辿り、XML はストリーミングで解析する。
+# <lastmod>・フィードの pubDate / published・URL 中の日付で古いエントリをページ取得前に落とし、
+# サイトマップインデックスでは lastmod が古い子サイトマップ自体を取得しない。
+# platform_url にパスがある場合（https://host/tag/x など）は、サイトマップのうちそのパス以下の URL だけを候補にする。
+
+CHUNK_SIZE = 64 * 1024
+# 1プラットフォームあたりに取得するサイトマップ・フィードの上限
+SITEMAP_MAX_FILES = int(os.getenv("SITEMAP_MAX_FILES", "50"))
+# 1プラットフォームあたりに返す候補URLの上限
+DISCOVERY_MAX_URLS = int(os.getenv("DISCOVERY_MAX_URLS", "200"))
+# 日付のわからないエントリを候補に加える上限（日付のあるエントリのあとに、この件数まで加える）
+DISCOVERY_MAX_UNDATED_URLS = int(os.getenv("DISCOVERY_MAX_UNDATED_URLS", "30"))
+DEFAULT_SITEMAP_PATHS = ("/sitemap.xml", "/sitemap_index.xml")
+FEED_TYPES = ("application/rss+xml", "application/atom+xml")
+# サイトマップ・フィードとして扱うルート要素
+ROOT_TAGS = ("urlset", "sitemapindex", "rss", "feed", "RDF")
+
+# URL 中の日付（/2025/02/24/ や /2025-02-24- など。日がなければ月末とみなす）
+URL_DATE_PATTERN = re.compile(r"(?<!\d)(20\d{2})[/_-](0?[1-9]|1[0-2])(?:[/_-](0?[1-9]|[12]\d|3[01]))?(?!\d)")
+
+
+@dataclass
+class DiscoveryResult:
+    urls: List[str] = field(default_factory=list)
+    sources: List[str] = field(default_factory=list)  # 解析できたサイトマップ・フィードのURL
+    files_fetched: int = 0
+    files_skipped: int = 0     # lastmod が古いため取得しなかった子サイトマップの数
+    entries_seen: int = 0
+    entries_dropped: int = 0   # 日付が古いため落としたエントリの数
+    entries_out_of_scope: int = 0  # platform_url のパス以下にないため落としたエントリの数
+    entries_undated: int = 0   # 日付がわからないエントリの数（DISCOVERY_MAX_UNDATED_URLS 件まで候補にする）
+
+    @property
+    def found(self) -> bool:
+        return bool(self.sources)
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(elem, *names):
+    for child in elem:
+        if _local_name(child.tag) in names:
+            return child
+    return None
+
+
+def _child_text(elem, *names) -> Optional[str]:
+    child = _child(elem, *names)
+    if child is None or child.text is None:
+        return None
+    return child.text.strip() or None
+
+
+def parse_date(text: Optional[str]) -> Optional[datetime.datetime]:
+    """
+    lastmod（W3C 日時）と pubDate（RFC 822）のどちらの形式でも解析する（タイムゾーンは getdate.py と同じく外す）
+    """
+    if not text:
+        return None
+    try:
+        return isoparse(text).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        pass
+    try:
+        return parsedate_to_datetime(text).replace(tzinfo=None)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def date_from_url(url: str) -> Optional[datetime.datetime]:
+    match = URL_DATE_PATTERN.search(urlparse(url).path)
+    if not match:
+        return None
+    year, month = int(match.group(1)), int(match.group(2))
+    day = int(match.group(3)) if match.group(3) else calendar.monthrange(year, month)[1]
+    try:
+        return datetime.datetime(year, month, day, 23, 59)
+    except ValueError:
+        return None
+
+
+def _iter_xml(url: str) -> Iterator[ET.Element]:
+    """
+    XML を取得しながら解析し、url / sitemap / item / entry の各要素を閉じた順に返す
+    .xml.gz のような圧縮されたサイトマップもそのまま展開する。
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    decompressor = None
+    root_checked = False
+    with fetcher.stream(url) as response:
+        response.raise_for_status()
+        for index, chunk in enumerate(response.iter_bytes(CHUNK_SIZE)):
+            if index == 0 and chunk[:2] == b"\x1f\x8b":
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if not root_checked:
+                    if _local_name(elem.tag) not in ROOT_TAGS:
+                        raise ValueError(f"サイトマップ・フィードではありません（<{_local_name(elem.tag)}>）")
+                    root_checked = True
+                if event == "end" and _local_name(elem.tag) in ("url", "sitemap", "item", "entry"):
+                    yield elem
+                    # 処理済みの要素は捨てて、サイトマップの大きさに関わらずメモリを一定に保つ
+                    elem.clear()
+    parser.close()
+
+
+def _entry(elem) -> Tuple[str, Optional[str], Optional[datetime.datetime]]:
+    """
+    (要素の種類, URL, 日時) を返す
+    """
+    kind = _local_name(elem.tag)
+    if kind in ("url", "sitemap"):
+        loc = _child_text(elem, "loc")
+        date_text = _child_text(elem, "lastmod")
+        news = _child(elem, "news")
+        if date_text is None and news is not None:
+            date_text = _child_text(news, "publication_date")
+        return kind, loc, parse_date(date_text)
+    if kind == "item":
+        return kind, _child_text(elem, "link"), parse_date(_child_text(elem, "pubDate", "date"))
+    # Atom の entry
+    link = None
+    for child in elem:
+        if _local_name(child.tag) == "link" and child.get("rel", "alternate") == "alternate":
+            link = child.get("href")
+            break
+    return kind, link, parse_date(_child_text(elem, "published", "updated"))
+
+
+def _sitemaps_from_robots(base_url: str) -> List[str]:
+    # robots.txt は fetcher がキャッシュしているものを使う
+    return list(fetcher.robots(base_url + "/").site_maps() or [])
+
+
+def _feeds_from_homepage(platform_url: str) -> List[str]:
+    try:
+        response = fetcher.get(platform_url)
+    except (httpx.HTTPError, RobotsDisallowed):
+        return []
+    if response.status_code != 200:
+        return []
+    soup = BeautifulSoup(response.content, "html.parser")
+    return [
+        urljoin(platform_url, link["href"])
+        for link in soup.find_all("link", rel="alternate", href=True)
+        if link.get("type") in FEED_TYPES
+    ]
+
+
+def _in_scope(url: str, host: str, path_prefix: str) -> bool:
+    parsed = urlparse(url)
+    if not (parsed.netloc == host or parsed.netloc.endswith("." + host)):
+        return False
+    return not path_prefix or parsed.path == path_prefix or parsed.path.startswith(path_prefix + "/")
+
+
+def discover_urls(platform_url: str, since: datetime.datetime) -> DiscoveryResult:
+    """
+    platform_url のサイトマップ・フィードから since 以降に更新された記事URLを集める
+    サイトマップもフィードも見つからなければ result.found が False になる（呼び出し側で Firecrawl に切り替える）。
+    """
+    result = DiscoveryResult()
+    parsed = urlparse(platform_url)
+    host = parsed.netloc
+    path_prefix = parsed.path.rstrip("/")
+    base_url = f"{parsed.scheme}://{parsed.netloc}"
+
+    pending = _sitemaps_from_robots(base_url) or [urljoin(base_url, path) for path in DEFAULT_SITEMAP_PATHS]
+    tried_feeds = False
+    seen_files = set()
+    seen_urls = set()
+    dated = []    # (日時, URL)
+    undated = []
+
+    while pending or not tried_feeds:
+        if not pending:
+            # サイトマップが1つも読めなかった場合だけ、トップページで案内されているフィードを使う
+            tried_feeds = True
+            if result.found:
+                break
+            pending = _feeds_from_homepage(platform_url)
+            continue
+        file_url = pending.pop(0)
+        if file_url in seen_files:
+            continue
+        if result.files_fetched >= SITEMAP_MAX_FILES:
+            print(f"サイトマップの取得数が上限 ({SITEMAP_MAX_FILES}) に達しました: {platform_url}")
+            break
+        seen_files.add(file_url)
+        result.files_fetched += 1
+        try:
+            in_scope = 0
+            for elem in _iter_xml(file_url):
+                kind, loc, date = _entry(elem)
+                if not loc:
+                    continue
+                if kind == "sitemap":
+                    # lastmod のない子サイトマップは中身を見ないとわからないので取得する
+                    if date is None or date >= since:
+                        pending.append(loc)
+                    else:
+                        result.files_skipped += 1
+                    continue
+                result.entries_seen += 1
+                # フィードは platform_url のページが案内しているものなので、記事のパスは問わない
+                if not _in_scope(loc, host, "" if kind in ("item", "entry") else path_prefix):
+                    result.entries_out_of_scope += 1
+                    continue
+                in_scope += 1
+                date = date or date_from_url(loc)
+                if date is not None and date < since:
+                    result.entries_dropped += 1
+                    continue
+                if loc in seen_urls:
+                    continue
+                seen_urls.add(loc)
+                if date is None:
+                    result.entries_undated += 1
+                    undated.append(loc)
+                else:
+                    dated.append((date, loc))
+            # 新しいエントリが0件でも、platform_url の範囲のエントリがあるサイトマップは情報源として数える
+            # （範囲外の URL しかないサイトマップでは、フィードや Firecrawl に切り替える）
+            if in_scope or not path_prefix:
+                result.sources.append(file_url)
+        except (httpx.HTTPError, RobotsDisallowed, ET.ParseError, ValueError, zlib.error) as e:
+            print(f"サイトマップの解析に失敗しました: {file_url} ({e})")
+
+    # 新しいものから順に、日付のわからないものは上限までを後ろに加える
+    dated.sort(key=lambda entry: entry[0], reverse=True)
+    result.urls = ([loc for _, loc in dated] + undated[:DISCOVERY_MAX_UNDATED_URLS])[:DISCOVERY_MAX_URLS]
+    print(
+        f"サイトマップ/フィード {result.files_fetched} 件を取得（古い子サイトマップ {result.files_skipped} 件は未取得）、"
+        f"エントリ {result.entries_seen} 件中 {result.entries_out_of_scope} 件を範囲外、{result.entries_dropped} 件を日付で除外し、"
+        f"{len(result.urls)} 件を候補にしました（日付不明 {result.entries_undated} 件）。"
+    )
+    return result
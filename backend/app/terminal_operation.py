@@ -1,13 +1,90 @@
-import subprocess
+import os
+import sys
 import time
+import subprocess
+import crawl_jobs
+import crawl_schedule
+import page_store
+import near_duplicates
+from web_Acquisition import MIN_LLM_CALLS_PER_ARTICLE, SUMMARIZE_MODE
+from url_acquisition import get_source_url_dict
+
+# クロールは crawl_job テーブルのジョブとして進める（途中で落ちても、再起動すれば続きから処理する）
+# このプロセスはクロールの時刻になったプラットフォームの discover ジョブを登録し、ワーカープロセスを起動・監視する。
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crawl_worker.py")
+# 起動するワーカープロセスの数
+WORKER_PROCESSES = int(os.getenv("CRAWL_WORKER_PROCESSES", "2"))
+# discover ジョブの登録や古いジョブの削除を確認する間隔（秒）
+SCHEDULE_INTERVAL_SECONDS = int(os.getenv("CRAWL_SCHEDULE_INTERVAL", "600"))
+# ワーカーの生存を確認する間隔（秒）
+MONITOR_INTERVAL_SECONDS = 30
+
+
+def schedule_discovery() -> int:
+    """
+    クロールの時刻になったプラットフォームの discover ジョブを登録する
+    キーに予定時刻を含むので、discover ジョブが次回の時刻を更新するまでは何度呼んでも1回分しか登録されない。
+    （試行回数を使い切った discover ジョブは crawl_worker.py が次回の時刻を後ろにずらすので、そこで登録し直される）
+    """
+    source_url_dict = get_source_url_dict()
+    due = crawl_schedule.due_sources(source_url_dict.keys())
+    jobs = [
+        (f"{source_id}:{scheduled_at.isoformat()}", {"source_id": source_id, "platform_url": source_url_dict[source_id]})
+        for source_id, scheduled_at in due.items()
+    ]
+    return crawl_jobs.enqueue("discover", jobs)
+
+
+def housekeeping():
+    queued = schedule_discovery()
+    if queued:
+        print(f"{queued} 件のプラットフォームの取得を登録しました。")
+    abandoned = crawl_jobs.fail_abandoned()
+    stale = crawl_schedule.finish_stale_crawls()
+    if stale:
+        print(f"公開日時の確認が終わらないクロール {stale} 件を、それまでの集計で記録しました。")
+    crawl_schedule.purge_tallies()
+    purged = crawl_jobs.purge_finished()
+    removed = page_store.purge()
+    print(
+        f"試行回数を使い切ったジョブ {abandoned} 件を失敗にし、古いジョブ {purged} 件・"
+        f"期限切れの保存済みページ {removed} 件を削除しました。"
+    )
+    # この仕組みより前に保存された記事も、重複の比較対象にする
+    fingerprinted = near_duplicates.backfill()
+    if fingerprinted:
+        print(f"既存の記事 {fingerprinted} 件の指紋を登録しました。")
+    duplicates = near_duplicates.count_duplicates(hours=24)
+    print(
+        f"直近24時間の重複記事: {duplicates} 件"
+        f"（LLM の呼び出しを少なくとも {duplicates * MIN_LLM_CALLS_PER_ARTICLE[SUMMARIZE_MODE]} 回削減）"
+    )
+    print(f"ジョブの状況: {crawl_jobs.stats()}")
+
+
+def start_worker() -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, WORKER_SCRIPT])
+
+
+def main():
+    workers = [start_worker() for _ in range(WORKER_PROCESSES)]
+    print(f"ワーカーを {len(workers)} 個起動しました。")
+    next_schedule_at = 0.0
+    while True:
+        if time.time() >= next_schedule_at:
+            try:
+                housekeeping()
+            except Exception as e:
+                print(f"ジョブの登録に失敗しました: {e}")
+            next_schedule_at = time.time() + SCHEDULE_INTERVAL_SECONDS
+        # 落ちたワーカーは起動し直す（処理中だったジョブはリースが切れたあとに再実行される）
+        for i, worker in enumerate(workers):
+            if worker.poll() is not None:
+                print(f"ワーカー (pid: {worker.pid}) が終了コード {worker.returncode} で終了したため、起動し直します。")
+                workers[i] = start_worker()
+        time.sleep(MONITOR_INTERVAL_SECONDS)
+
 
-while True:
-    # file1.py を実行
-    subprocess.run(["python", "/app/app/url_acquisition.py"], check=True)
-    print("url_acuisition.pyを実行しました。")
-    # file2.py を実行
-    subprocess.run(["python", "/app/app/embedd.py"], check=True)
-    print("embedd.pyを実行しました。")
-    print("今日の記事をすべて取得しました。")
-    # 24時間待機（86400秒）
-    time.sleep(86400)
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,17 @@ import datetime
 from dotenv import load_dotenv
 from firecrawl import FirecrawlApp
 # SQLAlchemy のインポート（MySQL 接続用）
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, BINARY, insert, select, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from typing import List, Dict
-import subprocess
+import asyncio
+import time
+import hashlib
+from getdate import screen_urls, RECENT_DAYS
+from sitemap_discovery import discover_urls
+import page_store
+import crawl_schedule
+from web_Acquisition import summarize_urls
 
 # ------------------------------
 # 環境変数の読み込み・API キー設定
@@ -20,9 +27,17 @@ FirecrawlApp.api_key = FIRECRAWL_API_KEY
 # MySQL の接続設定（適宜変更してください）
 # ------------------------------
 DATABASE_URL = "mysql+pymysql://user:password@db:3306/db?charset=utf8mb4"
-engine = create_engine(DATABASE_URL, echo=True)
+# SQL_ECHO=1 のときだけ発行した SQL をすべて出力する
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+engine = create_engine(DATABASE_URL, echo=SQL_ECHO)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+# 1プラットフォームあたり1回のクロールで要約する記事数の上限
+MAX_ARTICLES_PER_SOURCE = 30
+# 既存URLの確認（IN 句）と INSERT IGNORE を1文あたり何件ずつ行うか
+URL_BATCH_SIZE = int(os.getenv("URL_BATCH_SIZE", "1000"))
+# retrieved_urls.retrieved_url の長さの上限
+MAX_URL_LENGTH = 255
 
 # ------------------------------
 # モデル定義: source_url テーブル
@@ -40,11 +55,32 @@ class RetrievedURL(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     source_id = Column(Integer, ForeignKey("source_url.id"), nullable=False)
     retrieved_url = Column(String(255), nullable=False, unique=True)
+    # retrieved_url の SHA-256（重複確認はこの列のユニークインデックスで行う）
+    url_hash = Column(BINARY(32), nullable=True, unique=True)
     retrieved_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 # テーブル作成（存在しなければ）
 Base.metadata.create_all(bind=engine)
 
+def url_hash(url: str) -> bytes:
+    return hashlib.sha256(url.encode("utf-8")).digest()
+
+# ------------------------------
+# 関数: url_hash 列がない既存の retrieved_urls に列とインデックスを追加し、既存行を埋める
+# ------------------------------
+def migrate_url_hash():
+    columns = {column["name"] for column in inspect(engine).get_columns(RetrievedURL.__tablename__)}
+    if "url_hash" in columns:
+        return
+    print("retrieved_urls に url_hash 列を追加します。")
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE retrieved_urls ADD COLUMN url_hash BINARY(32) NULL"))
+        # MySQL の SHA2 は utf8mb4 のバイト列に対して計算されるので、url_hash() と同じ値になる
+        conn.execute(text("UPDATE retrieved_urls SET url_hash = UNHEX(SHA2(retrieved_url, 256)) WHERE url_hash IS NULL"))
+        conn.execute(text("ALTER TABLE retrieved_urls ADD UNIQUE INDEX uq_retrieved_urls_url_hash (url_hash)"))
+
+migrate_url_hash()
+
 # ------------------------------
 # 関数: source_url テーブルからプラットフォームURLとIDを辞書型で取得 {id: url}
 # ------------------------------
@@ -56,9 +92,21 @@ def get_source_url_dict() -> Dict[int, str]:
     return url_dict
 
 # ------------------------------
-# 関数: プラットフォームのサイトマップから全URLを取得（Firecrawl を使用）
+# 関数: プラットフォームのサイトマップ・フィードから最近更新されたURLを取得
+# 　　　サイトマップもフィードも見つからない場合だけ Firecrawl を使う
 # ------------------------------
 def retrieve_urls_from_platform(platform_url: str) -> List[str]:
+    since = datetime.datetime.now() - datetime.timedelta(days=RECENT_DAYS)
+    discovery = discover_urls(platform_url, since)
+    if discovery.found:
+        return discovery.urls
+    print("サイトマップ・フィードが見つからないため、Firecrawl で取得します。")
+    return retrieve_urls_with_firecrawl(platform_url)
+
+# ------------------------------
+# 関数: プラットフォームのサイトマップから全URLを取得（Firecrawl を使用）
+# ------------------------------
+def retrieve_urls_with_firecrawl(platform_url: str) -> List[str]:
     app = FirecrawlApp(api_key=FIRECRAWL_API_KEY)
     # まずは sitemapOnly=True で取得
     result = app.map_url(platform_url, params={"sitemapOnly": True, "includeSubdomains": True})
@@ -78,65 +126,118 @@ def retrieve_urls_from_platform(platform_url: str) -> List[str]:
             urls = []
     return urls
 
+# ------------------------------
+# 関数: 取得したURLのうち、まだ登録されていないものを返す
+# ------------------------------
+def find_new_urls(retrieved_urls: List[str]) -> List[str]:
+    # 重複しているURLを除去（順序は保つ）
+    retrieved_urls = list(dict.fromkeys(retrieved_urls))
+    too_long = [url for url in retrieved_urls if len(url) > MAX_URL_LENGTH]
+    if too_long:
+        print(f"{MAX_URL_LENGTH} 文字を超えるURL {len(too_long)} 件は登録しません。")
+        retrieved_urls = [url for url in retrieved_urls if len(url) <= MAX_URL_LENGTH]
+    hashes = [url_hash(url) for url in retrieved_urls]
+
+    # 候補のURLだけを url_hash のインデックスで照合する（登録済みの全URLは読み込まない）
+    existing_hashes = set()
+    with engine.connect() as conn:
+        for i in range(0, len(hashes), URL_BATCH_SIZE):
+            batch = hashes[i:i + URL_BATCH_SIZE]
+            rows = conn.execute(select(RetrievedURL.url_hash).where(RetrievedURL.url_hash.in_(batch)))
+            existing_hashes.update(row[0] for row in rows)
+    return [url for url, digest in zip(retrieved_urls, hashes) if digest not in existing_hashes]
+
+# ------------------------------
+# 関数: URLを retrieved_urls に登録し、登録した件数を返す
+# ------------------------------
+def record_urls(source_id: int, urls: List[str]) -> int:
+    inserted = 0
+    now = datetime.datetime.utcnow()
+    with engine.begin() as conn:
+        # 複数行の INSERT IGNORE で登録する（同時に他の処理が登録した分は無視される）
+        for i in range(0, len(urls), URL_BATCH_SIZE):
+            rows = [
+                {"source_id": source_id, "retrieved_url": url, "url_hash": url_hash(url), "retrieved_at": now}
+                for url in urls[i:i + URL_BATCH_SIZE]
+            ]
+            result = conn.execute(insert(RetrievedURL).prefix_with("IGNORE").values(rows))
+            inserted += result.rowcount
+    return inserted
+
 # ------------------------------
 # 関数: 新規のURLのみをデータベースに登録する
 # ------------------------------
 def insert_new_urls_for_platform(source_id: int, platform_url: str) -> List[str]:
-    # Firecrawl を用いてサイトマップからURL一覧を取得
+    # サイトマップ・フィード（なければ Firecrawl）からURL一覧を取得
     retrieved_urls = retrieve_urls_from_platform(platform_url)
-    # 重複しているURLを除去
-    retrieved_urls = list(set(retrieved_urls))
-    db = SessionLocal()
-    # 既に登録されているURL（対象の source_id で登録済み）の集合を取得
-    existing_urls = {record.retrieved_url for record in db.query(RetrievedURL).filter(RetrievedURL.source_id == source_id).all()}
+    start = time.perf_counter()
     # 新規のURLのみ抽出
-    new_urls = [url for url in retrieved_urls if url not in existing_urls]
-    for url in new_urls:
-        new_record = RetrievedURL(source_id=source_id, retrieved_url=url)
-        db.add(new_record)
-    db.commit()
-    db.close()
-    print(f"新規URL数: {len(new_urls)}")
+    new_urls = find_new_urls(retrieved_urls)
+    inserted = record_urls(source_id, new_urls)
+    elapsed = time.perf_counter() - start
+    rate = len(retrieved_urls) / elapsed if elapsed > 0 else 0.0
+    print(f"新規URL数: {len(new_urls)}（登録 {inserted} 件）")
+    print(f"{len(retrieved_urls)} 件のURLを {elapsed:.2f} 秒で照合・登録しました（{rate:.0f} 行/秒）。")
     print("新規URLの登録が完了しました。")
     return new_urls
 
 # ------------------------------
-# メイン処理: 各プラットフォームの新規URLを登録し、それぞれのURLに対して web_Acquisition.py を実行する
+# メイン処理: 各プラットフォームの新規URLを登録し、新しい記事を web_Acquisition の summarize_urls で要約する
 # ------------------------------
 def main():
+    # 期限切れの保存済みページを削除する（保存期間内のページは要約時に再取得せずに使う）
+    removed = page_store.purge()
+    print(f"期限切れの保存済みページを {removed} 件削除しました。")
     source_url_dict = get_source_url_dict()
-    for source_id, platform_url in source_url_dict.items():
+    # クロールの時刻になったプラットフォームだけを取得する（crawl_schedule の予定はジョブキューと共通）
+    due = crawl_schedule.due_sources(source_url_dict.keys())
+    print(f"{len(source_url_dict)} 件中 {len(due)} 件のプラットフォームがクロールの時刻です。")
+    for source_id in due:
+        platform_url = source_url_dict[source_id]
         print(f"処理中のプラットフォームID: {source_id}, URL: {platform_url}")
         new_urls = insert_new_urls_for_platform(source_id, platform_url)
-        filtered_urls = []
         print("公開日時を検索します。")
-        for url in new_urls:
-            try:
-                # getdate.py を引数付きで実行し、出力結果を取得
-                result = subprocess.run(
-                    ["python", "getdate.py", url],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                output = result.stdout.strip()
-                if "記事は今日から3日以内に公開されています" in output:
-                    filtered_urls.append(url)
-                else:
-                    print(f"→ このURLは3日以内ではないため除外されます。")
-            except subprocess.CalledProcessError as e:
-                print(f"URLの処理中にエラーが発生しました: {url}\nエラー内容: {e}")
+        # 公開日時の確認はプロセス内で非同期に行う（URLごとにサブプロセスを起動しない）
+        start = time.perf_counter()
+        checks = asyncio.run(screen_urls(new_urls))
+        elapsed = time.perf_counter() - start
+        filtered_urls = []
+        for check in checks:
+            if check.is_recent:
+                filtered_urls.append(check.url)
+            elif check.error:
+                print(f"→ {check.url} は除外されます: {check.error}")
+            else:
+                print(f"→ {check.url} は3日以内ではないため除外されます。公開日時: {check.published_date}")
+        print(f"{len(checks)} 件の公開日時を {elapsed:.1f} 秒で確認しました。")
 
         # 全てのURL処理後に、filtered_urls の件数を取得
         total_new = len(filtered_urls)
         print(f"このプラットフォームで新規記事URLは {total_new} 件です。")
-        
-        for idx, article_url in enumerate(filtered_urls, start=1):
-            remaining = total_new - idx
-            print(f"【進捗】{idx} 件目の記事URLを処理中。残り未実行URL数: {remaining} 件")
-            subprocess.run(["python", "web_Acquisition.py", article_url])
-            if idx >= 30:
-                break
+        # 未知のURLの数ではなく、公開日時の確認を通った記事の数で次回のクロール時刻を決める
+        crawl_schedule.record_crawl(source_id, total_new)
+
+        # 要約はプロセス内のワーカーで並行に行う（グラフと LLM クライアントは使い回す）
+        target_urls = filtered_urls[:MAX_ARTICLES_PER_SOURCE]
+        start = time.perf_counter()
+        results = summarize_urls(target_urls)
+        elapsed = time.perf_counter() - start
+        saved = 0
+        duplicates = 0
+        for idx, result in enumerate(results, start=1):
+            if result.saved:
+                saved += 1
+                print(f"【{idx}/{len(results)}】保存しました: {result.url} (article_id: {result.article_id}, {result.elapsed_seconds:.1f} 秒)")
+            elif result.duplicate_of:
+                duplicates += 1
+                print(f"【{idx}/{len(results)}】既存の記事と重複しています: {result.url} (article_id: {result.duplicate_of})")
+            else:
+                print(f"【{idx}/{len(results)}】保存されませんでした: {result.url} ({result.error})")
+        if results:
+            print(f"{len(results)} 件を {elapsed:.1f} 秒で要約しました（保存 {saved} 件、{len(results) / elapsed * 3600:.0f} 件/時）。")
+        if duplicates:
+            llm_calls_saved = sum(result.llm_calls_saved for result in results)
+            print(f"重複記事 {duplicates} 件の要約を省き、LLM の呼び出しを少なくとも {llm_calls_saved} 回減らしました。")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,239 @@
+import os
+import json
+import glob
+import datetime
+import threading
+import faiss
+import numpy as np
+
+#############################################################
+# FAISS インデックスのバージョン管理（embedd.py で公開し、main.py で読み込む）
+#
+# index_data/
+#   ├── faiss_index-<version>.faiss   バージョンごとのインデックス本体
+#   └── current.json                  現在公開中のバージョン情報（マニフェスト）
+#
+# どちらのファイルも一時ファイルに書き込んでから os.replace で置き換えるため、
+# API 側が書き込み途中のファイルを読むことはない。
+
+INDEX_DIR = os.getenv(
+    "INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data")
+)
+MANIFEST_NAME = "current.json"
+LEGACY_INDEX_NAME = "faiss_index.faiss"
+# 公開済みインデックスを何世代分残すか
+KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+# API がマニフェストの更新を確認する間隔（秒）
+RELOAD_INTERVAL_SECONDS = float(os.getenv("INDEX_RELOAD_INTERVAL", "60"))
+
+
+def _atomic_write_json(path: str, data: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_manifest(index_dir: str = INDEX_DIR):
+    """
+    現在公開中のインデックスのマニフェストを返す（未公開なら None）
+    """
+    manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def publish_index(index, index_dir: str = INDEX_DIR, extra: dict = None) -> dict:
+    """
+    インデックスを新しいバージョンとして保存し、マニフェストをアトミックに切り替える
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    version = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
+    file_name = f"faiss_index-{version}.faiss"
+    index_path = os.path.join(index_dir, file_name)
+
+    tmp_path = f"{index_path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+    manifest = {
+        "version": version,
+        "file": file_name,
+        "ntotal": int(index.ntotal),
+        "published_at": datetime.datetime.now().isoformat(),
+    }
+    if extra:
+        manifest.update(extra)
+    _atomic_write_json(os.path.join(index_dir, MANIFEST_NAME), manifest)
+
+    _remove_old_versions(index_dir, keep_file=file_name)
+    return manifest
+
+
+def _remove_old_versions(index_dir: str, keep_file: str):
+    paths = sorted(glob.glob(os.path.join(index_dir, "faiss_index-*.faiss")), reverse=True)
+    old_paths = [p for p in paths if os.path.basename(p) != keep_file][max(KEEP_VERSIONS - 1, 0):]
+    for path in old_paths:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"古いインデックスの削除に失敗しました: {path} ({e})")
+
+
+def is_id_mapped(index) -> bool:
+    # IndexIDMap / IndexIDMap2 なら検索結果が article.id になる
+    return hasattr(index, "id_map")
+
+
+def load_current_index(index_dir: str = INDEX_DIR):
+    """
+    公開中のインデックスを読み込んで (index, manifest) を返す
+    マニフェストがない場合は旧形式の faiss_index.faiss を読み込む。
+    ID マップのないインデックスは検索結果が article.id ではなく登録順の位置になるため、読み込まずにエラーにする。
+    """
+    manifest = read_manifest(index_dir)
+    if manifest is None:
+        file_name = LEGACY_INDEX_NAME
+        index = faiss.read_index(os.path.join(index_dir, file_name))
+        manifest = {"version": "legacy", "file": file_name, "ntotal": int(index.ntotal)}
+    else:
+        file_name = manifest["file"]
+        index = faiss.read_index(os.path.join(index_dir, file_name))
+    if not is_id_mapped(index):
+        raise RuntimeError(
+            f"{file_name} は article.id を持たない旧形式のインデックスです。"
+            "先に `python embedd.py --full` でインデックスを作り直してください。"
+        )
+    return index, manifest
+
+
+def _search_params(index, selector):
+    """
+    インデックスの種類に合った検索パラメータを作る
+    HNSW は専用のパラメータでないと受け付けず、efSearch も指定しないと既定値(16)に戻るため、
+    インデックスに保存されている efSearch を引き継ぐ。
+    """
+    base_index = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if isinstance(base_index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=base_index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+class IndexHolder:
+    """
+    API プロセスで使う FAISS インデックスの入れ物
+    バックグラウンドスレッドでマニフェストを監視し、新しいバージョンを読み込んでから差し替える。
+    検索は呼び出し時点のインデックスへの参照を掴んで行うため、差し替え中でも止まらない。
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR):
+        self.index_dir = index_dir
+        self._index = None
+        self._manifest = None
+        self._reload_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watcher = None
+        self._reload_listeners = []
+        self.loaded_at = None
+        self.last_error = None
+
+    def add_reload_listener(self, listener):
+        """
+        新しいバージョンに差し替えたときに listener(manifest) を呼び出す
+        """
+        self._reload_listeners.append(listener)
+
+    def load(self):
+        """
+        マニフェストのバージョンが変わっていれば読み込んで差し替える
+        差し替えた場合は True を返す
+        """
+        with self._reload_lock:
+            manifest = read_manifest(self.index_dir)
+            if (
+                self._index is not None
+                and manifest is not None
+                and manifest.get("version") == self._manifest.get("version")
+            ):
+                return False
+            if self._index is not None and manifest is None:
+                return False
+            index, manifest = load_current_index(self.index_dir)
+            # 参照の代入は 1 命令なので、検索中のスレッドは古いインデックスを使い続けられる
+            self._index, self._manifest = index, manifest
+            self.loaded_at = datetime.datetime.now()
+            print(f"FAISS インデックスを読み込みました。version: {manifest['version']}, ベクトル数: {index.ntotal}")
+        for listener in self._reload_listeners:
+            listener(manifest)
+        return True
+
+    def search(self, query_np, k: int, exclude_ids=None):
+        """
+        exclude_ids（article.id の int64 配列）を検索時に除外して上位 k 件を返す
+        """
+        index = self._index
+        if index is None:
+            raise RuntimeError("FAISS index is not loaded")
+        if exclude_ids is None or len(exclude_ids) == 0:
+            return index.search(query_np, k)
+        exclude_ids = np.ascontiguousarray(exclude_ids, dtype='int64')
+        batch = faiss.IDSelectorBatch(len(exclude_ids), faiss.swig_ptr(exclude_ids))
+        selector = faiss.IDSelectorNot(batch)
+        return index.search(query_np, k, params=_search_params(index, selector))
+
+    def reconstruct(self, article_id: int):
+        """
+        インデックスに登録されている記事のベクトルを返す（登録されていなければ None）
+        """
+        index = self._index
+        if index is None:
+            return None
+        try:
+            return index.reconstruct(int(article_id))
+        except RuntimeError:
+            return None
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def version(self):
+        return self._manifest.get("version") if self._manifest else None
+
+    def status(self) -> dict:
+        index = self._index
+        return {
+            "version": self.version,
+            "ntotal": int(index.ntotal) if index is not None else 0,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "last_error": self.last_error,
+        }
+
+    def start_watcher(self, interval: float = RELOAD_INTERVAL_SECONDS):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(
+            target=self._watch, args=(interval,), name="faiss-index-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop_event.set()
+
+    def _watch(self, interval: float):
+        while not self._stop_event.wait(interval):
+            try:
+                self.load()
+                self.last_error = None
+            except Exception as e:
+                # 読み込みに失敗しても現在のインデックスで検索を続ける
+                self.last_error = str(e)
+                print(f"FAISS インデックスの再読み込みに失敗しました: {e}")
@@ -1,23 +1,31 @@
 import os
 import re
 import json
+import time
 import datetime
-import requests
-from bs4 import BeautifulSoup
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from dotenv import load_dotenv
 from firecrawl import FirecrawlApp
 # LangChain のインポート（ChatOpenAI, プロンプト用）
 from langchain_community.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
 from langchain.schema import SystemMessage
-from langgraph.graph import StateGraph
-from typing import List, Dict
+from langgraph.graph import StateGraph, END
+from typing import List, Dict, Optional
+from pydantic import BaseModel, ValidationError
 from typing_extensions import TypedDict
 
 # SQLAlchemy のインポート（MySQL 接続用）
 from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
 from sqlalchemy.orm import sessionmaker, declarative_base
 import datetime
+import page_store
+import near_duplicates
+from content_extract import extract_main_text, trim_to_budget, count_tokens
+from getdate import extract_published_date, normalize_published_date
 
 # ------------------------------
 # 環境変数の読み込み・API キー設定
@@ -26,12 +34,24 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
 FirecrawlApp.api_key = FIRECRAWL_API_KEY
+LLM_MODEL_NAME = "gpt-4o-mini-2024-07-18"
+# summarize_urls で同時に要約する記事数
+SUMMARIZE_CONCURRENCY = int(os.getenv("SUMMARIZE_CONCURRENCY", "4"))
+# 要約パイプラインの方式（既定は従来の staged。structured は SUMMARIZE_MODE=structured で有効にする）
+#   "staged":     基本情報と詳細要約を別々の LLM 呼び出しで生成する（従来の方式）
+#   "structured": 1回の LLM 呼び出しで全項目を JSON で取得し、評価に落ちた項目だけを再生成する
+SUMMARIZE_MODE = os.getenv("SUMMARIZE_MODE", "staged")
+# structured 方式で項目を生成する回数の上限
+FIELDS_MAX_ATTEMPTS = 3
+# 1記事の要約に最低限かかる LLM の呼び出し回数（重複記事で節約できた回数の集計に使う）
+MIN_LLM_CALLS_PER_ARTICLE = {"structured": 1, "staged": 2}
 
 # ------------------------------
 # MySQL の接続設定（適宜変更してください）
 # ------------------------------
 DATABASE_URL = "mysql+pymysql://user:password@db:3306/db?charset=utf8mb4"
-engine = create_engine(DATABASE_URL, echo=True)
+# SQL_ECHO=1 のときだけ発行した SQL をすべて出力する
+engine = create_engine(DATABASE_URL, echo=os.getenv("SQL_ECHO", "0") == "1")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -65,26 +85,76 @@ class State(TypedDict):
     basic_status: str       # "success", "retry", "failed"（基本情報生成の評価結果）
     detailed_status: str    # "success", "retry", "failed"（詳細要約生成の評価結果）
     error: str              # エラー情報（任意）
+    article_id: int         # 保存した記事のID（保存しなかった場合は 0）
+    fields_attempt: int     # structured 方式での生成回数
+    failed_fields: List[str]  # structured 方式で評価に落ち、次に再生成する項目
+    extracted_date: str     # HTML（ld+json / time / meta）から抽出した公開日時（取得できなければ空）
+    simhash: int            # 本文の SimHash（短すぎて計算しなかった場合は 0）
+    duplicate_of: int       # 重複と判定した既存記事のID（重複でなければ 0）
+
+# ------------------------------
+# LLM クライアント（全ノード・全スレッドで1つを共有する）
+# ------------------------------
+@functools.lru_cache(maxsize=None)
+def get_llm() -> ChatOpenAI:
+    return ChatOpenAI(
+        model_name=LLM_MODEL_NAME,
+        temperature=0,
+        openai_api_key=OPENAI_API_KEY
+    )
 
 # ------------------------------
 # Node: 記事本文のスクレイピング
 # ------------------------------
 def scrape_content_node(state: State, config) -> State:
     url = state["url"]
+    # config["configurable"]["from_store"] が True のときは page_store の保存分だけを使い、ネットワークに接続しない
+    from_store = bool(((config or {}).get("configurable") or {}).get("from_store"))
     try:
-        resp = requests.get(url, timeout=10)
+        page = page_store.fetch(url, offline=from_store)
     except Exception as e:
         state["error"] = f"requests エラー: {e}"
         return state
-    if resp.status_code == 200:
-        html = resp.text
+    if page is None:
+        state["error"] = "page_store に保存されていません"
+        return state
+    if page.ok:
+        html = page.body
     else:
-        state["error"] = f"HTTP エラー: {resp.status_code}"
+        state["error"] = f"HTTP エラー: {page.status_code}"
         return state
-    soup = BeautifulSoup(html, "html.parser")
-    text = soup.get_text(separator="\n", strip=True)
+    # 公開日時はまず HTML の構造化データから取り出し、取れなかった場合だけ LLM に任せる
+    extracted_date = normalize_published_date(extract_published_date(html))
+    if extracted_date:
+        state["extracted_date"] = extracted_date
+        state["basic_info"] = {**state.get("basic_info", {}), "published_date": extracted_date}
+        print(f"[scrape_content] HTML から公開日時を取得しました: {extracted_date}")
+    # ナビゲーションやフッターなどを除いた本文だけを、トークン数の上限内で LLM に渡す（article.content にも保存する）
+    main_text, page_text = extract_main_text(html)
+    text, main_tokens, kept_tokens = trim_to_budget(main_text)
+    page_tokens = count_tokens(page_text)
     state["content"] = text
-    print("[scrape_content] 記事本文を取得しました。")
+    print(
+        f"[scrape_content] トークン数: ページ全体 {page_tokens} → 本文 {main_tokens} → 送信 {kept_tokens}"
+        f"（{page_tokens - kept_tokens} トークン削減）"
+    )
+    print(f"[scrape_content] 記事本文を取得しました。（{'保存済みページ' if page.from_store else 'ネットワーク'}から）")
+    return state
+
+# ------------------------------
+# Node: 重複記事の判定（転載・同時掲載された記事は要約せずに既存の記事へ紐付ける）
+# ------------------------------
+def check_duplicate_node(state: State, config) -> State:
+    fingerprint = near_duplicates.simhash(state.get("content", ""))
+    if fingerprint is None:
+        return state
+    state["simhash"] = fingerprint
+    duplicate = near_duplicates.find_duplicate(fingerprint)
+    if duplicate is not None:
+        article_id, distance = duplicate
+        near_duplicates.link_duplicate(state["url"], article_id, distance)
+        state["duplicate_of"] = article_id
+        print(f"[check_duplicate] 既存の記事 (article_id: {article_id}, 距離: {distance}) と重複するため、要約をスキップします。")
     return state
 
 # ------------------------------
@@ -93,24 +163,31 @@ def scrape_content_node(state: State, config) -> State:
 def generate_basic_info_node(state: State, config) -> State:
     state["basic_attempt"] = state.get("basic_attempt", 0) + 1
     print(f"[generate_basic_info] 試行回数 {state['basic_attempt']} 回目、URL: {state['url']}")
-    llm = ChatOpenAI(
-        model_name="gpt-4o-mini-2024-07-18",
-        temperature=0,
-        openai_api_key=OPENAI_API_KEY
-    )
+    llm = get_llm()
+    # HTML から公開日時が取れている場合は LLM に求めない
+    if state.get("extracted_date"):
+        system_content = (
+            "以下の文章から、記事のタイトル、150文字程度の要約を抽出してください。"
+            "なお、もしこの記事が日本語で書かれていない場合は、出力を '日本語の記事ではありません。' としてください。"
+            "出力はJSON形式で、キーは 'title', 'summary' としてください。"
+            "例: {"
+            "\"title\": \"サンプルタイトル\", "
+            "\"summary\": \"記事の要約テキスト。\""
+            "}"
+        )
+    else:
+        system_content = (
+            "以下の文章から、記事のタイトル、150文字程度の要約、公開日時を抽出してください。"
+            "なお、もしこの記事が日本語で書かれていない場合は、出力を '日本語の記事ではありません。' としてください。"
+            "出力はJSON形式で、キーは 'title', 'summary', 'published_date' としてください。"
+            "例: {"
+            "\"title\": \"サンプルタイトル\", "
+            "\"summary\": \"記事の要約テキスト。\", "
+            "\"published_date\": \"2025-02-24T09:30\""
+            "}"
+        )
     prompt_template = ChatPromptTemplate.from_messages([
-        SystemMessage(
-            content=(
-                "以下の文章から、記事のタイトル、150文字程度の要約、公開日時を抽出してください。"
-                "なお、もしこの記事が日本語で書かれていない場合は、出力を '日本語の記事ではありません。' としてください。"
-                "出力はJSON形式で、キーは 'title', 'summary', 'published_date' としてください。"
-                "例: {"
-                "\"title\": \"サンプルタイトル\", "
-                "\"summary\": \"記事の要約テキスト。\", "
-                "\"published_date\": \"2025-02-24T09:30\""
-                "}"
-            )
-        ),
+        SystemMessage(content=system_content),
         HumanMessagePromptTemplate.from_template("{text}")
     ])
     formatted_prompt = prompt_template.format_prompt(text=state["content"])
@@ -133,6 +210,9 @@ def generate_basic_info_node(state: State, config) -> State:
         parsed["summary150"] = parsed.pop("summary")
     else:
         parsed["summary150"] = ""
+    # HTML から取れた公開日時を使う
+    if state.get("extracted_date"):
+        parsed["published_date"] = state["extracted_date"]
     state["basic_info"] = parsed
     print("[generate_basic_info] 基本情報を生成しました。")
     return state
@@ -163,11 +243,7 @@ def evaluate_basic_info_node(state: State, config) -> State:
 def generate_detailed_summary_node(state: State, config) -> State:
     state["detailed_attempt"] = state.get("detailed_attempt", 0) + 1
     print(f"[generate_detailed_summary] 試行回数 {state['detailed_attempt']} 回目、URL: {state['url']}")
-    llm = ChatOpenAI(
-        model_name="gpt-4o-mini-2024-07-18",
-        temperature=0,
-        openai_api_key=OPENAI_API_KEY
-    )
+    llm = get_llm()
     if state.get("detailed_attempt", 0) == 1:
         # 1回目は、詳細な要約とともに重要キーワード（5個程度）を出力
         base_prompt = (
@@ -266,20 +342,148 @@ def save_article_node(state: State, config) -> State:
         db.add(new_article)
         db.commit()
         db.refresh(new_article)
+        state["article_id"] = new_article.id
         db.close()
+        # 以降に取得する転載記事と比較できるよう、本文の指紋を登録する
+        if state.get("simhash"):
+            near_duplicates.store_fingerprint(new_article.id, state["simhash"], created_at=new_article.created_at)
         print("[save_article] 記事情報をデータベースに保存しました。")
     else:
         print("[save_article] 生成が不成功のため、記事情報は保存されませんでした。")
     return state
 
+# ------------------------------
+# structured 方式: 全項目を1回の LLM 呼び出しで取得する
+# ------------------------------
+class ArticleFields(BaseModel):
+    """
+    LLM が返す JSON のスキーマ（再生成時は一部の項目だけが返るので、すべて省略可能にしている）
+    """
+    is_japanese: Optional[bool] = None
+    title: Optional[str] = None
+    summary150: Optional[str] = None
+    summary1000: Optional[str] = None
+    published_date: Optional[str] = None
+    keywords: Optional[List[str]] = None
+
+ARTICLE_FIELDS = ("title", "summary150", "summary1000", "published_date", "keywords")
+FIELD_INSTRUCTIONS = {
+    "title": "\"title\": 記事のタイトル",
+    "summary150": "\"summary150\": 150文字程度の要約",
+    "summary1000": "\"summary1000\": 約1000文字程度の詳細な要約（1000文字以内）",
+    "published_date": "\"published_date\": 公開日時（\"2025-02-24T09:30\" の形式）",
+    "keywords": "\"keywords\": 記事に関する重要なキーワード5個の配列",
+}
+
+def build_fields_prompt(fields: List[str], keywords: List[str]) -> str:
+    lines = [
+        "以下の文章について、次のキーを持つJSONオブジェクトだけを出力してください。",
+        "\"is_japanese\": 記事が日本語で書かれていれば true、そうでなければ false",
+    ]
+    lines += [FIELD_INSTRUCTIONS[field] for field in fields]
+    if "summary1000" in fields and "keywords" not in fields and keywords:
+        lines.append(f"【注意】summary1000 には重要キーワード {', '.join(keywords)} を必ず含めてください。")
+    elif "summary1000" in fields:
+        lines.append("【注意】summary1000 には keywords の各キーワードを必ず含めてください。")
+    return "\n".join(lines)
+
+def parse_article_fields(raw_output: str) -> ArticleFields:
+    json_text = re.sub(r"^```(?:json)?\s*", "", raw_output.strip())
+    json_text = re.sub(r"\s*```$", "", json_text)
+    data = json.loads(json_text)
+    if not isinstance(data, dict):
+        raise ValueError("JSON オブジェクトではありません")
+    return ArticleFields(**data)
+
+def generate_article_fields_node(state: State, config) -> State:
+    state["fields_attempt"] = state.get("fields_attempt", 0) + 1
+    # 初回は全項目（HTML から公開日時が取れていれば公開日時を除く）、2回目以降は評価に落ちた項目だけを生成する
+    fields = state.get("failed_fields") or [
+        field for field in ARTICLE_FIELDS
+        if not (field == "published_date" and state.get("extracted_date"))
+    ]
+    print(f"[generate_article_fields] 試行回数 {state['fields_attempt']} 回目、項目: {', '.join(fields)}、URL: {state['url']}")
+    llm = get_llm().bind(response_format={"type": "json_object"})
+    prompt_template = ChatPromptTemplate.from_messages([
+        SystemMessage(content=build_fields_prompt(fields, state.get("detailed_keywords", []))),
+        HumanMessagePromptTemplate.from_template("{text}")
+    ])
+    messages = prompt_template.format_prompt(text=state["content"]).to_messages()
+    result = llm.invoke(messages)
+    try:
+        parsed = parse_article_fields(result.content)
+    except (ValueError, ValidationError) as e:
+        # 出力全体が壊れている場合は、同じ項目をもう一度生成する
+        state["failed_fields"] = fields
+        state["error"] = f"JSON の検証に失敗しました: {e}"
+        print(f"[generate_article_fields] JSON の検証に失敗しました: {e}")
+        return state
+    if parsed.is_japanese is False:
+        state["basic_status"] = "skip"
+        print("[generate_article_fields] 記事が日本語ではないため、生成をスキップします。")
+        return state
+
+    basic_info = state.get("basic_info", {})
+    for field in ("title", "summary150", "published_date"):
+        if field in fields:
+            basic_info[field] = getattr(parsed, field) or ""
+    state["basic_info"] = basic_info
+    if "summary1000" in fields:
+        state["detailed_summary"] = parsed.summary1000 or ""
+    if "keywords" in fields:
+        state["detailed_keywords"] = parsed.keywords or []
+    print("[generate_article_fields] 項目を生成しました。")
+    return state
+
+def evaluate_article_fields_node(state: State, config) -> State:
+    """
+    各項目を評価し、落ちた項目を failed_fields に入れる（全項目が通れば保存へ進む）
+    """
+    if state.get("basic_status") == "skip":
+        return state
+    basic_info = state.get("basic_info", {})
+    summary = state.get("detailed_summary", "")
+    keywords = state.get("detailed_keywords", [])
+    failed = {}
+
+    if not basic_info.get("title"):
+        failed["title"] = "タイトルが空です"
+    if not basic_info.get("summary150") or len(basic_info["summary150"]) > 200:
+        failed["summary150"] = "150字要約が空か長すぎます"
+    try:
+        datetime.datetime.fromisoformat(basic_info.get("published_date", ""))
+    except Exception as e:
+        failed["published_date"] = f"公開日時が無効です: {e}"
+    if len(keywords) != 5:
+        failed["keywords"] = f"期待する重要キーワードの数は5個ですが、取得されたのは {len(keywords)} 個です。"
+    if not summary or len(summary) > 1000:
+        failed["summary1000"] = "詳細な要約が空か1000文字を超えています"
+    elif "keywords" not in failed:
+        summary_lower = summary.lower()
+        missing = [kw for kw in keywords if kw.lower() not in summary_lower]
+        if len(keywords) - len(missing) < 4:
+            failed["summary1000"] = f"重要キーワードのうち {len(keywords) - len(missing)}/5 が含まれています。不足: {', '.join(missing)}"
+
+    state["failed_fields"] = [field for field in ARTICLE_FIELDS if field in failed]
+    if failed:
+        state["basic_status"] = "retry"
+        state["detailed_status"] = "retry"
+        state["error"] = " / ".join(failed.values())
+        print(f"[evaluate_article_fields] 再生成する項目: {', '.join(state['failed_fields'])}（{state['error']}）")
+    else:
+        state["basic_status"] = "success"
+        state["detailed_status"] = "success"
+        print("[evaluate_article_fields] 全項目が評価を通過しました。")
+    return state
+
 # ------------------------------
 # 条件付きエッジの関数
 # ------------------------------
 def basic_info_decision(state: State, config) -> str:
     if state.get("basic_status") == "success":
         return "generate_detailed_summary"
-    elif state.get("basic_attempt", 0) >= 3:
-        return "skip"
+    elif state.get("basic_status") == "skip" or state.get("basic_attempt", 0) >= 3:
+        return END
     else:
         return "generate_basic_info"
 
@@ -287,15 +491,33 @@ def detailed_summary_decision(state: State, config) -> str:
     if state.get("detailed_status") == "success":
         return "save_article"
     elif state.get("detailed_attempt", 0) >= 5:
-        return "skip"
+        return END
     else:
         return "generate_detailed_summary"
 
+def scrape_content_decision(state: State, config) -> str:
+    # 本文が取得できなかった記事では LLM を呼ばない
+    return "check_duplicate" if state.get("content") else END
+
+def duplicate_decision(next_node: str):
+    def decide(state: State, config) -> str:
+        return END if state.get("duplicate_of") else next_node
+    return decide
+
+def article_fields_decision(state: State, config) -> str:
+    if state.get("basic_status") == "success" and state.get("detailed_status") == "success":
+        return "save_article"
+    elif state.get("basic_status") == "skip" or state.get("fields_attempt", 0) >= FIELDS_MAX_ATTEMPTS:
+        return END
+    else:
+        return "generate_article_fields"
+
 # ------------------------------
 # LangGraph のグラフ構築
 # ------------------------------
 graph_builder = StateGraph(State)
 graph_builder.add_node("scrape_content", scrape_content_node)
+graph_builder.add_node("check_duplicate", check_duplicate_node)
 graph_builder.add_node("generate_basic_info", generate_basic_info_node)
 graph_builder.add_node("evaluate_basic_info", evaluate_basic_info_node)
 graph_builder.add_node("generate_detailed_summary", generate_detailed_summary_node)
@@ -309,22 +531,49 @@ graph_builder.add_conditional_edges("evaluate_detailed_summary", detailed_summar
 
 # Entry と Exit の設定
 graph_builder.set_entry_point("scrape_content")
-graph_builder.add_edge("scrape_content", "generate_basic_info")
+graph_builder.add_edge("scrape_content", "check_duplicate")
+graph_builder.add_conditional_edges("check_duplicate", duplicate_decision("generate_basic_info"))
 graph_builder.add_edge("generate_basic_info", "evaluate_basic_info")
 graph_builder.add_edge("generate_detailed_summary", "evaluate_detailed_summary")
 graph_builder.set_finish_point("save_article")
 
+# structured 方式のグラフ
+structured_graph_builder = StateGraph(State)
+structured_graph_builder.add_node("scrape_content", scrape_content_node)
+structured_graph_builder.add_node("check_duplicate", check_duplicate_node)
+structured_graph_builder.add_node("generate_article_fields", generate_article_fields_node)
+structured_graph_builder.add_node("evaluate_article_fields", evaluate_article_fields_node)
+structured_graph_builder.add_node("save_article", save_article_node)
+structured_graph_builder.set_entry_point("scrape_content")
+structured_graph_builder.add_conditional_edges("scrape_content", scrape_content_decision)
+structured_graph_builder.add_conditional_edges("check_duplicate", duplicate_decision("generate_article_fields"))
+structured_graph_builder.add_edge("generate_article_fields", "evaluate_article_fields")
+structured_graph_builder.add_conditional_edges("evaluate_article_fields", article_fields_decision)
+structured_graph_builder.set_finish_point("save_article")
+
+# グラフのコンパイルはプロセスで1回だけ行い、全記事で使い回す
+summarize_graphs = {
+    "staged": graph_builder.compile(),
+    "structured": structured_graph_builder.compile(),
+}
+
 # ------------------------------
-# メイン処理: 単一のURLを処理して記事情報を取得し、DBに保存
+# 複数URLの要約（プロセス内のワーカーで並行に処理する）
 # ------------------------------
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        print("使い方: python web_acquisition_ver2.py <記事URL>")
-        sys.exit(1)
-    input_url = sys.argv[1].strip()
-    initial_state: State = {
-        "url": input_url,
+@dataclass
+class SummaryResult:
+    url: str
+    saved: bool
+    article_id: Optional[int] = None
+    elapsed_seconds: float = 0.0
+    error: Optional[str] = None
+    crashed: bool = False   # 例外で中断した（再実行すれば成功する可能性がある）
+    duplicate_of: Optional[int] = None  # 重複として紐付けた既存記事のID
+    llm_calls_saved: int = 0            # 重複のため呼ばずに済んだ LLM の呼び出し回数（最低限の回数）
+
+def make_initial_state(url: str) -> State:
+    return {
+        "url": url,
         "content": "",
         "basic_info": {},
         "detailed_summary": "",
@@ -333,9 +582,84 @@ if __name__ == "__main__":
         "detailed_attempt": 0,
         "basic_status": "",
         "detailed_status": "",
-        "error": ""
+        "error": "",
+        "article_id": 0,
+        "fields_attempt": 0,
+        "failed_fields": [],
+        "extracted_date": "",
+        "simhash": 0,
+        "duplicate_of": 0
     }
-    config = None
-    graph = graph_builder.compile()
-    final_state = graph.invoke(initial_state)
+
+def summarize_url(url: str, from_store: bool = False, mode: str = SUMMARIZE_MODE) -> SummaryResult:
+    """
+    1件の記事URLを要約してDBに保存し、結果を返す（例外は結果の error に入れて返す）
+    """
+    start = time.perf_counter()
+    config = {"configurable": {"from_store": from_store}}
+    try:
+        final_state = summarize_graphs[mode].invoke(make_initial_state(url.strip()), config=config)
+    except Exception as e:
+        return SummaryResult(url, False, elapsed_seconds=time.perf_counter() - start, error=str(e), crashed=True)
+    article_id = final_state.get("article_id") or None
+    duplicate_of = final_state.get("duplicate_of") or None
+    return SummaryResult(
+        url,
+        article_id is not None,
+        article_id=article_id,
+        elapsed_seconds=time.perf_counter() - start,
+        error=None if article_id is not None or duplicate_of is not None else (final_state.get("error") or None),
+        duplicate_of=duplicate_of,
+        llm_calls_saved=MIN_LLM_CALLS_PER_ARTICLE[mode] if duplicate_of is not None else 0
+    )
+
+def summarize_urls(
+    urls: List[str],
+    concurrency: int = SUMMARIZE_CONCURRENCY,
+    from_store: bool = False,
+    mode: str = SUMMARIZE_MODE
+) -> List[SummaryResult]:
+    """
+    複数の記事URLを最大 concurrency 件ずつ並行に要約し、入力と同じ順序で結果を返す
+    LLM の応答待ちが処理時間の大半なので、スレッドで並行させると記事数/時間が concurrency に比例して伸びる。
+    """
+    if not urls:
+        return []
+    if mode not in summarize_graphs:
+        raise ValueError(f"Unknown summarize mode: {mode}")
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="summarize") as executor:
+        return list(executor.map(lambda url: summarize_url(url, from_store=from_store, mode=mode), urls))
+
+# ------------------------------
+# メイン処理: 指定したURLを処理して記事情報を取得し、DBに保存
+# ------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="記事URLを要約してDBに保存する")
+    parser.add_argument("urls", nargs="+", help="記事URL（複数指定可）")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=SUMMARIZE_CONCURRENCY,
+        help="同時に要約する記事数"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=sorted(summarize_graphs),
+        default=SUMMARIZE_MODE,
+        help="要約パイプラインの方式"
+    )
+    parser.add_argument(
+        "--from-store",
+        action="store_true",
+        help="ページを取得せず page_store の保存分から要約する（期限切れでも使う）"
+    )
+    args = parser.parse_args()
+    results = summarize_urls(args.urls, concurrency=args.concurrency, from_store=args.from_store, mode=args.mode)
+    for result in results:
+        if result.saved:
+            print(f"保存しました: {result.url} (article_id: {result.article_id}, {result.elapsed_seconds:.1f} 秒)")
+        elif result.duplicate_of:
+            print(f"既存の記事と重複しています: {result.url} (article_id: {result.duplicate_of})")
+        else:
+            print(f"保存されませんでした: {result.url} ({result.error})")
     print("処理が完了しました。")